@@ -0,0 +1,173 @@
+import argparse, datetime, json, logging, os, shutil, sys
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from pathlib import Path
+
+import modules.collector as collector
+import modules.prometheus as prom
+from main import CONF_FILE, FETCH_CONCURRENCY, LOGLEVEL, ORIGIN_TZ, OURA_API_URL, build_history_store, build_http_client, build_token_providers, get_personal_info
+from modules.oura import Oura, OuraRateLimitError
+
+BACKFILL_CATEGORIES = ('daily_activity', 'daily_readiness', 'daily_resilience', 'daily_sleep', 'daily_spo2', 'daily_stress', 'heartrate')
+
+def escape_label_value(value:str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_sample(name:str, labels:dict, value:float, timestamp:float) -> str:
+    label_str = ','.join(f'{k}="{escape_label_value(str(v))}"' for k, v in labels.items())
+    return f"{name}{{{label_str}}} {value!r} {timestamp:.3f}\n"
+
+class BackfillWriter:
+    """Streams timestamped samples into one part file per metric family.
+
+    OpenMetrics requires every family's samples to be contiguous, so samples are appended to
+    per-family part files as chunks complete and concatenated into the output once at the end.
+    The checkpoint stores the next chunk and each part's size, so an interrupted run resumes by
+    truncating the parts back to the last completed chunk.
+    """
+
+    def __init__(self, output:Path, families:dict[str, tuple[str, str]]):
+        self.output = output
+        self.families = families
+        self.parts_dir = output.with_name(output.name + '.parts')
+        self.checkpoint_path = output.with_name(output.name + '.checkpoint')
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        self._files = {}
+
+    def load_checkpoint(self) -> datetime.date | None:
+        if not self.checkpoint_path.exists():
+            return None
+        with self.checkpoint_path.open(encoding="utf-8") as fp:
+            checkpoint = json.load(fp)
+        for name, size in checkpoint['parts'].items():
+            with (self.parts_dir / f"{name}.om").open('r+b') as fp:
+                fp.truncate(size)
+        for part in self.parts_dir.glob('*.om'):
+            if part.stem not in checkpoint['parts']:
+                part.unlink()
+        return datetime.date.fromisoformat(checkpoint['next_chunk'])
+
+    def write(self, family:str, line:str) -> None:
+        if family not in self._files:
+            self._files[family] = (self.parts_dir / f"{family}.om").open('a', encoding="utf-8")
+        self._files[family].write(line)
+
+    def save_checkpoint(self, next_chunk:datetime.date) -> None:
+        parts = {}
+        for name, fp in self._files.items():
+            fp.flush()
+            parts[name] = fp.tell()
+        for part in self.parts_dir.glob('*.om'):
+            parts.setdefault(part.stem, part.stat().st_size)
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with tmp_path.open('w', encoding="utf-8") as fp:
+            json.dump({'next_chunk': next_chunk.isoformat(), 'parts': parts}, fp)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def finish(self) -> None:
+        for fp in self._files.values():
+            fp.close()
+        with self.output.open('w', encoding="utf-8") as out:
+            for name, (metric_type, desc) in self.families.items():
+                part = self.parts_dir / f"{name}.om"
+                if not part.exists():
+                    continue
+                out.write(f"# HELP {name} {desc}\n# TYPE {name} {metric_type}\n")
+                with part.open(encoding="utf-8") as fp:
+                    shutil.copyfileobj(fp, out)
+            out.write("# EOF\n")
+        shutil.rmtree(self.parts_dir)
+        self.checkpoint_path.unlink(missing_ok=True)
+
+def metric_families(categories:list[prom.OuraCategoryConfig]) -> dict[str, tuple[str, str]]:
+    families = {}
+    for category in categories:
+        for m in category.metrics:
+            if m.type in ('gauge', 'counter'):
+                families[category.prefix + m.name] = (m.type, m.desc)
+            elif m.type == 'info':
+                families[category.prefix + m.name] = ('info', m.desc)
+    return families
+
+def write_records(writer:BackfillWriter, category:prom.OuraCategoryConfig, records:list, labels:dict) -> int:
+    written = 0
+    for record in records:
+        timestamp = collector.record_timestamp(record, ORIGIN_TZ)
+        for m in category.metrics:
+            try:
+                value = attrgetter(m.iterator if m.iterator != None else m.name)(record)
+            except AttributeError:
+                continue
+            for name, sample_labels, sample_value in prom.metric_samples(m, category.prefix, labels, value):
+                writer.write(category.prefix + m.name, format_sample(name, sample_labels, sample_value, timestamp))
+                written += 1
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write historical Oura data as timestamped OpenMetrics for `promtool tsdb create-blocks-from openmetrics`.")
+    parser.add_argument('--start', type=datetime.date.fromisoformat, required=True, help="first day to backfill (YYYY-MM-DD)")
+    parser.add_argument('--end', type=datetime.date.fromisoformat, default=datetime.date.today(), help="day to stop before (YYYY-MM-DD, defaults to today)")
+    parser.add_argument('--output', type=Path, default=Path('backfill.om'), help="OpenMetrics file to write")
+    parser.add_argument('--chunk-days', type=int, default=7, help="days requested per API call")
+    parser.add_argument('--parallel-chunks', type=int, default=4, help="chunks fetched concurrently per user and category")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=LOGLEVEL, format='%(asctime)s - %(levelname)s : %(message)s', datefmt="%Y-%m-%dT%H:%M:%S%z")
+
+    metrics_definitions = prom.load_oura_metrics_configs(CONF_FILE)
+    categories = [ c for c in metrics_definitions.categories if c.name in BACKFILL_CATEGORIES ]
+
+    http_client = build_http_client()
+    history = build_history_store()
+    users = []
+    for name, token_provider in build_token_providers(http_client).items():
+        oura = Oura(token_provider=token_provider, http_client=http_client, url=OURA_API_URL)
+        try:
+            personal_info = get_personal_info(oura, name)
+        except OuraRateLimitError as e:
+            logging.error(f"Oura rate limited {name} ({e}); skipping.")
+            continue
+        if personal_info == None:
+            logging.error(f"Oura authentication failed for {name}; skipping.")
+            continue
+        if history != None:
+            oura.history = history.for_user(personal_info.id)
+        users.append((oura, { 'email': personal_info.email }))
+    if len(users) == 0:
+        logging.fatal("No Oura user could be authenticated.")
+        sys.exit(1)
+
+    writer = BackfillWriter(args.output, metric_families(categories))
+    chunk_start = writer.load_checkpoint() or args.start
+    if chunk_start > args.start:
+        logging.info(f"Resuming backfill from {chunk_start}.")
+
+    step = datetime.timedelta(days=args.chunk_days)
+    with ThreadPoolExecutor(max_workers=int(FETCH_CONCURRENCY)) as executor:
+        while chunk_start < args.end:
+            chunks = []
+            while chunk_start < args.end and len(chunks) < args.parallel_chunks:
+                chunks.append((chunk_start, min(chunk_start + step, args.end)))
+                chunk_start += step
+
+            futures = [
+                (category, labels, start, executor.submit(collector.fetch_category_range, oura, category.name, start, end, ORIGIN_TZ))
+                for start, end in chunks for oura, labels in users for category in categories
+            ]
+            written = 0
+            for category, labels, start, future in futures:
+                try:
+                    metrics = future.result()
+                except Exception as e:
+                    logging.fatal(f"Fetching {category.name} from {start} raised an error: {e}; re-run to resume from the last checkpoint.")
+                    sys.exit(1)
+                if metrics == None:
+                    logging.fatal(f"Fetching {category.name} from {start} failed; re-run to resume from the last checkpoint.")
+                    sys.exit(1)
+                written += write_records(writer, category, metrics.data, labels)
+
+            writer.save_checkpoint(min(chunk_start, args.end))
+            logging.info(f"Backfilled {chunks[0][0]} to {chunks[-1][1]}: {written} samples.")
+
+    writer.finish()
+    logging.info(f"Wrote {args.output}. Import it with `promtool tsdb create-blocks-from openmetrics {args.output} <data dir>`.")
@@ -0,0 +1,82 @@
+"""End-to-end collection cycle benchmark against the local mock Oura API.
+
+Starts benchmarks.mock_oura_server in a subprocess, prepares users the way main.py does and
+runs the dispatcher through full cycles in which every category of every user is fetched.
+Reports wall time, CPU time of the exporter process, peak RSS and requests per cycle. The
+first cycle loads the initial sync window; later cycles are incremental unless --cold.
+
+Usage: uv run python -m benchmarks.cycle_benchmark [--users 1] [--cycles 5] [--cold] [mock server options]
+"""
+import argparse
+import os
+import resource
+import statistics
+import time
+
+def rss_mib() -> float:
+    with open("/proc/self/statm") as fp:
+        return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+if __name__ == "__main__":
+    from benchmarks import mock_oura_server
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=5, help="collection cycles to run")
+    parser.add_argument('--cold', action='store_true', help="start every cycle with fresh users, watermarks and caches")
+    parser.add_argument('--concurrency', type=int, default=4, help="FETCH_CONCURRENCY for the dispatcher")
+    mock_oura_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    mock, port = mock_oura_server.spawn(mock_oura_server.config_from_args(args))
+    os.environ.setdefault("TZ", "UTC")
+    os.environ["OURA_API_URL"] = f"http://127.0.0.1:{port}/v2"
+
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+
+    from prometheus_client import CollectorRegistry
+
+    import modules.collector as collector
+    import modules.prometheus as prom
+    from main import CONF_FILE, ORIGIN_TZ, build_http_client, prepare_user
+    from modules.dispatcher import Dispatcher
+    from modules.oauth import StaticTokenProvider
+
+    logging.basicConfig(level=logging.WARNING)
+    categories = prom.load_oura_metrics_configs(CONF_FILE).categories
+    intervals = { c.name: 3600.0 for c in categories }
+    http_client = build_http_client()
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+
+    def build_dispatcher() -> Dispatcher:
+        users = list(executor.map(lambda i: prepare_user(f"user{i}", StaticTokenProvider(f"user{i}"), http_client, intervals), range(args.users)))
+        return Dispatcher(
+            users, collector.compile_plan(categories, CollectorRegistry()), executor,
+            concurrency=args.concurrency, per_user_concurrency=args.concurrency, deadline=60.0, tz=ORIGIN_TZ,
+        )
+
+    print(f"{args.users} users, {len(categories)} categories, {args.heartrate_per_day} heartrate samples/day, {args.pages} pages/response")
+    print(f"{'cycle':>5} {'wall ms':>10} {'cpu ms':>10} {'requests':>9} {'rss MiB':>9}")
+    try:
+        dispatcher = build_dispatcher()
+        walls, cpus = [], []
+        for cycle in range(args.cycles):
+            if args.cold and cycle > 0:
+                dispatcher = build_dispatcher()
+            requests_before = http_client.stats()["requests"]
+            wall_started, cpu_started = time.perf_counter(), time.process_time()
+            for user in dispatcher.users:
+                for name in dispatcher.plans:
+                    user.scheduler.trigger(name)
+            dispatcher.run_once()
+            while not dispatcher.idle:
+                dispatcher.run_once()
+            wall, cpu = time.perf_counter() - wall_started, time.process_time() - cpu_started
+            walls.append(wall)
+            cpus.append(cpu)
+            requests = http_client.stats()["requests"] - requests_before
+            print(f"{cycle:>5} {wall * 1000:>10.1f} {cpu * 1000:>10.1f} {requests:>9} {rss_mib():>9.1f}")
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"median wall {statistics.median(walls) * 1000:.1f} ms, median cpu {statistics.median(cpus) * 1000:.1f} ms, peak RSS {peak:.1f} MiB")
+    finally:
+        mock.terminate()
@@ -0,0 +1,50 @@
+"""Compare the compiled response decoders against the previous dacite path.
+
+Usage: uv run python -m benchmarks.decode_benchmark [samples]
+"""
+import dataclasses
+import datetime
+import sys
+import time
+import tracemalloc
+
+from dacite import Config, from_dict
+
+from modules.oura_dataclasses import OuraHeartRate, OuraHeartRates, decode
+
+CAST_CONFIG = Config({
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+})
+
+# The dataclasses as they were before slots=True, for a like-for-like memory comparison.
+LegacyHeartRate = dataclasses.make_dataclass("OuraHeartRate", [ (f.name, f.type) for f in dataclasses.fields(OuraHeartRate) ])
+LegacyHeartRates = dataclasses.make_dataclass("OuraHeartRates", [("data", list[LegacyHeartRate]), ("next_token", str | None)])
+
+def heartrate_payload(samples:int) -> dict:
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return {
+        "data": [
+            {"bpm": 50 + i % 60, "source": "awake", "timestamp": (start + datetime.timedelta(seconds=5 * i)).isoformat()}
+            for i in range(samples)
+        ],
+        "next_token": None,
+    }
+
+def measure(name:str, func, payload:dict) -> None:
+    func(payload)  # warm up (builds the compiled decoder once)
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(payload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    records = len(result.data)
+    print(f"{name:<10} {records / elapsed:>12,.0f} records/s {elapsed * 1000:>9.1f} ms {peak / 1024 / 1024:>8.1f} MiB peak")
+
+if __name__ == "__main__":
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 17280  # one day of 5s samples
+    payload = heartrate_payload(samples)
+    print(f"decoding {samples} heartrate samples")
+    measure("dacite", lambda p: from_dict(data_class=LegacyHeartRates, data=p, config=CAST_CONFIG), payload)
+    measure("compiled", lambda p: decode(OuraHeartRates, p), payload)
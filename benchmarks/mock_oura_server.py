@@ -0,0 +1,275 @@
+"""Local stand-in for api.ouraring.com serving synthetic usercollection data and OAuth tokens.
+
+Bearer tokens `user0` … `user<N-1>` are accepted and each maps to its own synthetic user.
+The token endpoint hands out access tokens equal to the refresh token it is given. Sizes,
+latency and error injection are configurable, so the exporter can be benchmarked without
+touching the real API: OURA_API_URL=http://localhost:8080/v2 OURA_TOKEN_URL=http://localhost:8080/oauth/token
+
+Usage: uv run python -m benchmarks.mock_oura_server [--port 8080] [--users 1] [--heartrate-per-day 17280] ...
+"""
+import argparse
+import dataclasses
+import datetime
+import gzip
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules import oura_dataclasses
+
+RECORD_CLASSES = {
+    'daily_activity': oura_dataclasses.OuraDailyActivity,
+    'daily_readiness': oura_dataclasses.OuraDailyReadiness,
+    'daily_resilience': oura_dataclasses.OuraDailyResilience,
+    'daily_sleep': oura_dataclasses.OuraDailySleep,
+    'daily_spo2': oura_dataclasses.OuraDailySpo2,
+    'daily_stress': oura_dataclasses.OuraDailyStress,
+}
+MET_ITEMS = 288  # one value per 5 minutes
+
+@dataclasses.dataclass
+class MockConfig:
+    users: int = 1
+    heartrate_per_day: int = 17280
+    pages: int = 1
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    token_expires_in: int = 86400
+
+def synthetic_value(field_type, name:str, rng:random.Random, day:datetime.date, timestamp:datetime.datetime):
+    field_type, _ = oura_dataclasses._unwrap_optional(field_type)
+    if dataclasses.is_dataclass(field_type):
+        return synthetic_record(field_type, rng, day, timestamp)
+    if typing.get_origin(field_type) is list:
+        return [ round(rng.uniform(0.9, 8.0), 3) for _ in range(MET_ITEMS) ]
+    if field_type is datetime.datetime:
+        return timestamp.isoformat()
+    if field_type is datetime.date:
+        return day.isoformat()
+    if field_type is str:
+        if name == 'class_5_min':
+            return ''.join(rng.choice('012345') for _ in range(MET_ITEMS))
+        return rng.choice(('restored', 'normal', 'stressful')) if name == 'day_summary' else f"{name}-{day.isoformat()}"
+    if field_type is float:
+        return round(rng.uniform(0, 100), 2)
+    return rng.randint(0, 100)
+
+def synthetic_record(data_class, rng:random.Random, day:datetime.date, timestamp:datetime.datetime) -> dict:
+    return { f.name: synthetic_value(f.type, f.name, rng, day, timestamp) for f in dataclasses.fields(data_class) }
+
+def daily_records(category:str, user:str, start:datetime.date, end:datetime.date) -> list[dict]:
+    records = []
+    day = start
+    while day <= end:
+        # Seeded by user and day, so repeated requests return identical payloads.
+        rng = random.Random(f"{user}/{category}/{day}")
+        timestamp = datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc)
+        record = synthetic_record(RECORD_CLASSES[category], rng, day, timestamp)
+        record['id'] = f"{user}-{category}-{day.isoformat()}"
+        records.append(record)
+        day += datetime.timedelta(days=1)
+    return records
+
+def heartrate_records(user:str, start:datetime.datetime, end:datetime.datetime, per_day:int) -> list[dict]:
+    step = 86400 / per_day
+    first = int(start.timestamp() // step + 1)
+    last = int(end.timestamp() // step)
+    rng = random.Random(user)
+    base = rng.randint(50, 70)
+    return [
+        {
+            "bpm": base + (i * 7919) % 40,
+            "source": "awake",
+            "timestamp": datetime.datetime.fromtimestamp(i * step, datetime.timezone.utc).isoformat(),
+        }
+        for i in range(first, last + 1)
+    ]
+
+class MockOuraServer:
+    def __init__(self, config:MockConfig, port:int = 0):
+        self.config = config
+        self.requests: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="mock-oura", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def count(self, path:str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def collection(self, category:str, user:str, query:dict) -> list[dict] | None:
+        if category == 'heartrate':
+            return heartrate_records(
+                user,
+                datetime.datetime.fromisoformat(query['start_datetime']),
+                datetime.datetime.fromisoformat(query['end_datetime']),
+                self.config.heartrate_per_day,
+            )
+        if category in RECORD_CLASSES:
+            return daily_records(
+                category, user,
+                datetime.date.fromisoformat(query['start_date']),
+                datetime.date.fromisoformat(query['end_date']),
+            )
+        return None
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+        config = self.config
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                query = { k: v[0] for k, v in urllib.parse.parse_qs(url.query).items() }
+                parts = url.path.strip('/').split('/')
+                if len(parts) < 3 or parts[:2] != ['v2', 'usercollection']:
+                    self._reply(404, { "detail": "Not Found" })
+                    return
+                category = parts[2]
+                mock.count(category)
+                if self._inject():
+                    return
+
+                user = self.headers.get("Authorization", "").removeprefix("Bearer ")
+                if user not in { f"user{i}" for i in range(config.users) }:
+                    self._reply(401, { "detail": "Unauthorized" })
+                    return
+                if category == 'personal_info':
+                    self._reply(200, { "id": user, "age": 30, "weight": 60.0, "height": 1.7, "biological_sex": "female", "email": f"{user}@example.com" })
+                    return
+                if len(parts) == 4 and category in RECORD_CLASSES:
+                    day = datetime.date.fromisoformat(parts[3][-10:])  # ids end with the record's day
+                    self._reply(200, daily_records(category, user, day, day)[0])
+                    return
+
+                records = mock.collection(category, user, query)
+                if records is None:
+                    self._reply(404, { "detail": "Not Found" })
+                    return
+                page = int(query.get('next_token', 0))
+                page_size = -(-len(records) // config.pages) if records else 1
+                chunk = records[page * page_size:(page + 1) * page_size]
+                next_token = str(page + 1) if (page + 1) * page_size < len(records) else None
+                self._reply(200, { "data": chunk, "next_token": next_token })
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                mock.count('oauth_token')
+                if urllib.parse.urlsplit(self.path).path.rstrip('/') != '/oauth/token':
+                    self._reply(404, { "detail": "Not Found" })
+                    return
+                if self._inject():
+                    return
+                form = { k: v[0] for k, v in urllib.parse.parse_qs(body).items() }
+                user = form.get('refresh_token') or form.get('code') or 'user0'
+                self._reply(200, {
+                    "access_token": user,
+                    "refresh_token": user,
+                    "token_type": "bearer",
+                    "expires_in": config.token_expires_in,
+                })
+
+            def _inject(self) -> bool:
+                if config.latency or config.latency_jitter:
+                    time.sleep(config.latency + random.uniform(0, config.latency_jitter))
+                roll = random.random()
+                if roll < config.error_rate:
+                    self._reply(500, { "detail": "Injected error" })
+                    return True
+                if roll < config.error_rate + config.rate_limit_rate:
+                    self._reply(429, { "detail": "Injected rate limit" }, { "Retry-After": "1" })
+                    return True
+                return False
+
+            def _reply(self, status:int, payload:dict, headers:dict | None = None):
+                body = json.dumps(payload).encode()
+                encoding = None
+                if 'gzip' in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    encoding = 'gzip'
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if encoding:
+                    self.send_header("Content-Encoding", encoding)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def add_arguments(parser:argparse.ArgumentParser) -> None:
+    parser.add_argument('--users', type=int, default=1, help="number of synthetic users (tokens user0 … userN-1)")
+    parser.add_argument('--heartrate-per-day', type=int, default=17280, help="heartrate samples per day (17280 = every 5s)")
+    parser.add_argument('--pages', type=int, default=1, help="pages each collection response is split into")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="random extra seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction of requests answered 429")
+
+def config_from_args(args:argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        users=args.users,
+        heartrate_per_day=args.heartrate_per_day,
+        pages=args.pages,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+
+def spawn(config:MockConfig) -> tuple[subprocess.Popen, int]:
+    """Run the mock in a subprocess, so its CPU time and memory are not measured with the exporter's."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    command = [
+        sys.executable, "-m", "benchmarks.mock_oura_server", "--port", str(port),
+        "--users", str(config.users), "--heartrate-per-day", str(config.heartrate_per_day), "--pages", str(config.pages),
+        "--latency", str(config.latency), "--latency-jitter", str(config.latency_jitter),
+        "--error-rate", str(config.error_rate), "--rate-limit-rate", str(config.rate_limit_rate),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/")
+        except urllib.error.HTTPError:
+            return process, port  # answering, if only with 404
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock Oura server did not start")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = MockOuraServer(config_from_args(args), args.port)
+    print(f"serving mock Oura API on http://127.0.0.1:{server.port}/v2 for {args.users} users", flush=True)
+    server.server.serve_forever()
@@ -0,0 +1,62 @@
+"""Compare decoding every field of the daily responses against decoding only the fields metrics.yml reads.
+
+Decodes a 7-day response of every configured daily category for each synthetic user, first
+with full decoding and then with the projections compile_plan derives from config/metrics.yml (or the given file).
+Reports dataclass decode throughput (JSON parsing is the same for both and not timed) and
+the memory the decoded responses keep alive once the parsed JSON is dropped.
+
+Usage: uv run python -m benchmarks.projection_benchmark [users] [metrics.yml]
+"""
+import datetime
+import gc
+import json
+import sys
+import time
+import tracemalloc
+import typing
+
+from prometheus_client import CollectorRegistry
+
+import modules.collector as collector
+import modules.prometheus as prom
+from benchmarks.mock_oura_server import daily_records
+from modules.oura import Oura
+from modules.oura_dataclasses import decode
+
+DAYS = 7
+
+def measure(name:str, bodies:list[tuple[type, bytes]], repeat:int = 5) -> None:
+    payloads = [ (data_class, json.loads(body)) for data_class, body in bodies ]
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for data_class, payload in payloads:
+            decode(data_class, payload)
+        timings.append(time.perf_counter() - started)
+    del payloads
+    elapsed = min(timings)
+
+    gc.collect()
+    tracemalloc.start()
+    results = [ decode(data_class, json.loads(body)) for data_class, body in bodies ]
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    records = sum(len(r.data) for r in results)
+    print(f"{name:<10} {records / elapsed:>12,.0f} records/s {elapsed * 1000:>9.1f} ms {retained / 1024 / 1024:>8.2f} MiB retained")
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    conf_file = sys.argv[2] if len(sys.argv) > 2 else "./config/metrics.yml"
+    categories = [ c for c in prom.load_oura_metrics_configs(conf_file).categories if c.name in collector.DAILY_CATEGORIES ]
+    end = datetime.date(2024, 1, 31)
+    start = end - datetime.timedelta(days=DAYS - 1)
+    bodies = []
+    for c in categories:
+        data_class = typing.get_type_hints(getattr(Oura, f"get_{c.name}"))["return"]
+        bodies.extend( (data_class, json.dumps({ "data": daily_records(c.name, f"user{i}", start, end), "next_token": None }).encode()) for i in range(users) )
+    print(f"decoding {DAYS}-day responses of {len(categories)} daily categories for {users} users")
+
+    measure("full", bodies)
+    collector.compile_plan(categories, CollectorRegistry())
+    measure("projected", bodies)
@@ -0,0 +1,72 @@
+"""Local stand-in for a Prometheus remote_write endpoint.
+
+Decodes every pushed WriteRequest and prints its samples, so push mode can be checked
+without a TSDB: REMOTE_WRITE_URL=http://localhost:9201/api/v1/write
+
+Usage: uv run python -m benchmarks.remote_write_receiver [port]
+"""
+import struct
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules import snappy
+
+def read_varint(data:bytes, pos:int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def read_fields(data:bytes):
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            size, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + size], pos + size
+        else:
+            raise ValueError(f"unsupported wire type {wire_type}")
+        yield number, value
+
+def decode_write_request(payload:bytes) -> list[tuple[dict, float, int]]:
+    samples = []
+    for _, series in read_fields(payload):
+        labels, points = {}, []
+        for number, value in read_fields(series):
+            if number == 1:
+                label = dict(read_fields(value))
+                labels[label[1].decode()] = label[2].decode()
+            elif number == 2:
+                point = dict(read_fields(value))
+                points.append((struct.unpack("<d", point[1])[0], point.get(2, 0)))
+        samples.extend((labels, v, ts) for v, ts in points)
+    return samples
+
+class RemoteWriteHandler(BaseHTTPRequestHandler):
+    received: list = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        samples = decode_write_request(snappy.decompress(body))
+        RemoteWriteHandler.received.extend(samples)
+        for labels, value, timestamp in samples:
+            print(f"{timestamp} {labels} {value}")
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9201
+    print(f"listening on http://localhost:{port}/api/v1/write")
+    ThreadingHTTPServer(("", port), RemoteWriteHandler).serve_forever()
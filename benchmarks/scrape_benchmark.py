@@ -0,0 +1,46 @@
+"""Compare rendering /metrics on every scrape against serving the cached exposition.
+
+Fills a registry with every daily metric in config/metrics.yml for the given number of users,
+then answers gzip scrapes the way prometheus_client's server does (render and compress each
+time) and from ExpositionCache, which renders once and hands out the same bytes afterwards.
+
+Usage: uv run python -m benchmarks.scrape_benchmark [users] [scrapes]
+"""
+import gzip
+import logging
+import sys
+import time
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.exposition import choose_encoder
+
+import modules.collector as collector
+import modules.prometheus as prom
+from benchmarks.update_benchmark import RECORD_CLASSES, plan_cycle, sample_record
+from modules.exposition import ExpositionCache
+
+def measure(name:str, func, scrapes:int) -> None:
+    size = len(func())
+    started = time.perf_counter()
+    for _ in range(scrapes):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<8} {scrapes / elapsed:>12,.0f} scrapes/s {elapsed / scrapes * 1000:>9.3f} ms/scrape {size / 1024:>8.1f} KiB")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    definitions = prom.load_oura_metrics_configs('config/metrics.yml')
+    categories = [ c for c in definitions.categories if c.name in RECORD_CLASSES ]
+    records = { name: sample_record(cls) for name, cls in RECORD_CLASSES.items() }
+    registry = CollectorRegistry()
+    plans = collector.compile_plan(categories, registry)
+    plan_cycle(categories, records, plans, [ [f"user{i}@example.com"] for i in range(user_count) ])
+
+    encoder, _ = choose_encoder(None)
+    print(f"{user_count} users, {len(encoder(registry).splitlines())} exposition lines")
+    measure("render", lambda: gzip.compress(encoder(registry)), scrapes)
+    cache = ExpositionCache(registry)
+    measure("cached", lambda: cache.get(None).gzipped, scrapes)
@@ -0,0 +1,50 @@
+"""Compare peak memory of whole-body and streaming decoding of a large heartrate response.
+
+Serves `days` of 5-second heartrate samples from the mock Oura API and fetches them
+once with response.json() plus the compiled decoder, and once with the streaming parser.
+
+Usage: uv run python -m benchmarks.stream_benchmark [days]
+"""
+import datetime
+import sys
+import time
+import tracemalloc
+
+from benchmarks.mock_oura_server import MockConfig, spawn
+from modules.oauth import StaticTokenProvider
+from modules.oura import Oura
+from modules.oura_dataclasses import OuraHeartRates
+
+def measure(name:str, func) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} {records:>9} records {elapsed * 1000:>9.1f} ms {peak / 1024 / 1024:>8.1f} MiB peak")
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    server, port = spawn(MockConfig(heartrate_per_day=17280))
+    oura = Oura(StaticTokenProvider("user0"), url=f"http://127.0.0.1:{port}/v2")
+    end = datetime.datetime.now(datetime.timezone.utc)
+    params = { "start_datetime": (end - datetime.timedelta(days=days)).isoformat(), "end_datetime": end.isoformat() }
+    print(f"fetching {days} days of heartrate")
+
+    def whole_body() -> int:
+        count = 0
+        for records in oura.iter_pages("heartrate", OuraHeartRates, **params):
+            count += len(records)
+        return count
+
+    def streaming() -> int:
+        count = 0
+        for _ in oura.iter_records("heartrate", OuraHeartRates, **params):
+            count += 1
+        return count
+
+    whole_body()  # warm up connections and decoders
+    measure("json", whole_body)
+    measure("streaming", streaming)
+    server.terminate()
@@ -0,0 +1,92 @@
+"""Compare the compiled metric update plan against the previous per-cycle lookups.
+
+Both paths set every daily metric in config/metrics.yml from one record per user; the legacy
+path rebuilds an attrgetter and walks the metric dicts for every value like apply_category did.
+
+Usage: uv run python -m benchmarks.update_benchmark [users] [cycles]
+"""
+import dataclasses
+import datetime
+import logging
+import sys
+import time
+import typing
+from operator import attrgetter
+
+from prometheus_client import CollectorRegistry
+
+import modules.collector as collector
+import modules.prometheus as prom
+from modules import oura_dataclasses
+
+RECORD_CLASSES = {
+    'daily_activity': oura_dataclasses.OuraDailyActivity,
+    'daily_readiness': oura_dataclasses.OuraDailyReadiness,
+    'daily_resilience': oura_dataclasses.OuraDailyResilience,
+    'daily_sleep': oura_dataclasses.OuraDailySleep,
+    'daily_spo2': oura_dataclasses.OuraDailySpo2,
+    'daily_stress': oura_dataclasses.OuraDailyStress,
+}
+
+def sample_value(field_type):
+    field_type, _ = oura_dataclasses._unwrap_optional(field_type)
+    if dataclasses.is_dataclass(field_type):
+        return sample_record(field_type)
+    if typing.get_origin(field_type) is list:
+        return [ sample_value(typing.get_args(field_type)[0]) for _ in range(3) ]
+    if field_type is datetime.datetime:
+        return datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    if field_type is datetime.date:
+        return datetime.date(2024, 1, 1)
+    if field_type is str:
+        return "sample"
+    return 1
+
+def sample_record(data_class):
+    return data_class(**{ f.name: sample_value(f.type) for f in dataclasses.fields(data_class) })
+
+def legacy_cycle(categories, records, registry, root_metrics, users):
+    for labels in users:
+        for category in categories:
+            record = records[category.name]
+            metrics = root_metrics.setdefault(category.name, {})
+            for m in category.metrics:
+                value = attrgetter(m.iterator if m.iterator != None else m.name)(record)
+                if not m.name in metrics:
+                    metrics[m.name] = prom.create_metric_instance(m, registry, category.prefix)
+                prom.set_metrics(metrics[m.name], labels, value)
+
+def plan_cycle(categories, records, plans, users):
+    for labels in users:
+        label_values = tuple(labels)
+        for category in categories:
+            record = records[category.name]
+            for m in plans[category.name].metrics:
+                m.setter(label_values)(m.extract(record))
+
+def measure(name:str, func, cycles:int, updates:int) -> None:
+    func()  # warm up (registers metrics and binds labelled children)
+    started = time.perf_counter()
+    for _ in range(cycles):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<8} {updates * cycles / elapsed:>12,.0f} updates/s {elapsed / cycles * 1000:>9.3f} ms/cycle")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    definitions = prom.load_oura_metrics_configs('config/metrics.yml')
+    categories = [ c for c in definitions.categories if c.name in RECORD_CLASSES ]
+    records = { name: sample_record(cls) for name, cls in RECORD_CLASSES.items() }
+    users = [ [f"user{i}@example.com"] for i in range(user_count) ]
+    updates = user_count * sum(len(c.metrics) for c in categories)
+    print(f"{updates} metric updates per cycle ({user_count} users)")
+
+    legacy_registry = CollectorRegistry()
+    root_metrics = {}
+    measure("legacy", lambda: legacy_cycle(categories, records, legacy_registry, root_metrics, users), cycles, updates)
+
+    plans = collector.compile_plan(categories, CollectorRegistry())
+    measure("plan", lambda: plan_cycle(categories, records, plans, users), cycles, updates)
@@ -0,0 +1,60 @@
+"""Local stand-in for Oura's webhook deliveries.
+
+Runs the verification challenge against a receiver started with WEBHOOK_PORT, then posts
+signed events the way Oura does, so webhook mode can be checked without a subscription.
+Set OURA_CLIENT_SECRET and WEBHOOK_VERIFICATION_TOKEN to the receiver's values.
+
+Usage: uv run python -m benchmarks.webhook_sender <user_id> <data_type> [object_id] [url] [events]
+"""
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+def send(url:str, secret:str | None, event:dict) -> int:
+    body = json.dumps(event).encode()
+    timestamp = str(int(time.time()))
+    headers = { "Content-Type": "application/json", "x-oura-timestamp": timestamp }
+    if secret:
+        headers["x-oura-signature"] = hmac.new(secret.encode(), timestamp.encode() + body, hashlib.sha256).hexdigest().upper()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers)) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def verify(url:str, token:str) -> bytes:
+    query = urllib.parse.urlencode({ "verification_token": token, "challenge": "oura-exporter" })
+    with urllib.request.urlopen(f"{url}?{query}") as response:
+        return response.read()
+
+if __name__ == "__main__":
+    user_id, data_type = sys.argv[1], sys.argv[2]
+    object_id = sys.argv[3] if len(sys.argv) > 3 else None
+    url = sys.argv[4] if len(sys.argv) > 4 else "http://localhost:8001/"
+    events = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+
+    token = os.environ.get("WEBHOOK_VERIFICATION_TOKEN")
+    if token:
+        print(f"challenge: {verify(url, token).decode()}")
+
+    secret = os.environ.get("OURA_CLIENT_SECRET")
+    started = time.perf_counter()
+    statuses = {}
+    for _ in range(events):
+        status = send(url, secret, {
+            "event_type": "update",
+            "data_type": data_type,
+            "object_id": object_id,
+            "event_time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "user_id": user_id,
+        })
+        statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - started
+    print(f"sent {events} events in {elapsed * 1000:.1f} ms: {statuses}")
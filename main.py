@@ -1,11 +1,24 @@
-import os,time,yaml, logging, sys, datetime, zoneinfo
-from operator import attrgetter
+import os,yaml, logging, sys, datetime, threading, time, zoneinfo
+from concurrent.futures import ThreadPoolExecutor
 
-from prometheus_client import CollectorRegistry, start_http_server
+from prometheus_client import CollectorRegistry
 
+import modules.collector as collector
 import modules.prometheus as prom
-from modules.oauth import OAuthTokenManager, StaticTokenProvider
-from modules.oura import Oura
+import modules.telemetry as telemetry
+from modules.dispatcher import Dispatcher
+from modules.exposition import DEFAULT_MAX_AGE, ExpositionCache, ExpositionServer, PublishedMetrics
+from modules.history import DEFAULT_HEARTRATE_SETTLE, DEFAULT_SETTLE_DAYS, HistoryStore
+from modules.http_client import HttpClient
+from modules.oauth import TOKEN_URL, OAuthTokenManager, StaticTokenProvider
+from modules.oura import API_URL, Oura, OuraRateLimitError
+from modules.pull import ScrapeCollector
+from modules.remote_write import RemoteWriter
+from modules.scheduler import CategoryScheduler
+from modules.snapshot import SnapshotStore
+from modules.sync import SyncWatermarks
+from modules.users import OuraUser, load_token_managers
+from modules.webhook import WebhookReceiver
 
 ORIGIN_TZ = zoneinfo.ZoneInfo(os.environ.get("TZ"))
 OURA_ACCESS_TOKEN = os.environ.get("OURA_ACCESS_TOKEN", None)
@@ -14,31 +27,80 @@ OURA_CLIENT_SECRET = os.environ.get("OURA_CLIENT_SECRET")
 OURA_REDIRECT_URI = os.environ.get("OURA_REDIRECT_URI", "http://localhost:8000/callback")
 OURA_SCOPES = os.environ.get("OURA_SCOPES")
 OURA_TOKEN_PATH = os.environ.get("OURA_TOKEN_PATH", os.path.expanduser("~/.config/oura-exporter/oauth_token.json"))
+OURA_TOKEN_DIR = os.environ.get("OURA_TOKEN_DIR")
 OURA_AUTH_CODE = os.environ.get("OURA_AUTH_CODE")
 OURA_AUTH_CODE_FILE = os.environ.get("OURA_AUTH_CODE_FILE")
+OURA_API_URL = os.environ.get("OURA_API_URL", API_URL)
+OURA_TOKEN_URL = os.environ.get("OURA_TOKEN_URL", TOKEN_URL)
 HTTP_PORT = os.environ.get('PORT', 8000)
+METRICS_CACHE_MAX_AGE = os.environ.get('METRICS_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
 LOGLEVEL = os.environ.get('LOGLEVEL', logging.INFO)
+FETCH_CONCURRENCY = os.environ.get('FETCH_CONCURRENCY', 4)
+CYCLE_DEADLINE = os.environ.get('CYCLE_DEADLINE', 45)
+USER_CONCURRENCY = os.environ.get('USER_CONCURRENCY', 2)
+PULL_MODE = os.environ.get('PULL_MODE', 'false').lower() == 'true'
+POLL_INTERVAL = os.environ.get('POLL_INTERVAL', 60)
+POLL_JITTER = os.environ.get('POLL_JITTER', 0.1)
+SYNC_INITIAL_DAYS = os.environ.get('SYNC_INITIAL_DAYS', 7)
+EXPORT_DAYS = os.environ.get('EXPORT_DAYS', 0)
+SYNC_OVERLAP_DAYS = os.environ.get('SYNC_OVERLAP_DAYS', 1)
+SYNC_HEARTRATE_OVERLAP_MINUTES = os.environ.get('SYNC_HEARTRATE_OVERLAP_MINUTES', 15)
+REMOTE_WRITE_URL = os.environ.get('REMOTE_WRITE_URL')
+REMOTE_WRITE_USERNAME = os.environ.get('REMOTE_WRITE_USERNAME')
+REMOTE_WRITE_PASSWORD = os.environ.get('REMOTE_WRITE_PASSWORD')
+REMOTE_WRITE_BEARER_TOKEN = os.environ.get('REMOTE_WRITE_BEARER_TOKEN')
+REMOTE_WRITE_BATCH_SIZE = os.environ.get('REMOTE_WRITE_BATCH_SIZE', 500)
+REMOTE_WRITE_QUEUE_SIZE = os.environ.get('REMOTE_WRITE_QUEUE_SIZE', 10000)
+WEBHOOK_PORT = os.environ.get('WEBHOOK_PORT')
+WEBHOOK_VERIFICATION_TOKEN = os.environ.get('WEBHOOK_VERIFICATION_TOKEN')
+WEBHOOK_POLL_INTERVAL = os.environ.get('WEBHOOK_POLL_INTERVAL', 21600)
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH')
+SNAPSHOT_HEARTRATE = os.environ.get('SNAPSHOT_HEARTRATE', 'false').lower() == 'true'
+HISTORY_PATH = os.environ.get('HISTORY_PATH')
+HISTORY_SETTLE_DAYS = os.environ.get('HISTORY_SETTLE_DAYS', DEFAULT_SETTLE_DAYS)
+HISTORY_HEARTRATE_SETTLE_HOURS = os.environ.get('HISTORY_HEARTRATE_SETTLE_HOURS', DEFAULT_HEARTRATE_SETTLE.total_seconds() / 3600)
+HTTP_POOL_SIZE = os.environ.get('HTTP_POOL_SIZE', 10)
+HTTP_CONNECT_TIMEOUT = os.environ.get('HTTP_CONNECT_TIMEOUT', 5)
+HTTP_READ_TIMEOUT = os.environ.get('HTTP_READ_TIMEOUT', 15)
+HTTP_RETRIES = os.environ.get('HTTP_RETRIES', 3)
 CONF_FILE = 'config/metrics.yml'
 
-if __name__ == "__main__":
+def build_http_client() -> HttpClient:
+    return HttpClient(
+        pool_size=int(HTTP_POOL_SIZE),
+        connect_timeout=float(HTTP_CONNECT_TIMEOUT),
+        read_timeout=float(HTTP_READ_TIMEOUT),
+        retries=int(HTTP_RETRIES),
+    )
 
-    logger = logging.getLogger(__name__)
-    logging.basicConfig(level=LOGLEVEL, format='%(asctime)s - %(levelname)s : %(message)s', datefmt="%Y-%m-%dT%H:%M:%S%z")
-
-    metrics_definitions = prom.load_oura_metrics_configs(CONF_FILE)
+def build_history_store() -> HistoryStore | None:
+    if not HISTORY_PATH:
+        return None
+    return HistoryStore(
+        HISTORY_PATH,
+        settle_days=int(HISTORY_SETTLE_DAYS),
+        heartrate_settle=datetime.timedelta(hours=float(HISTORY_HEARTRATE_SETTLE_HOURS)),
+        tz=ORIGIN_TZ,
+    )
 
-    registry = CollectorRegistry()
-    start_http_server(int(HTTP_PORT), registry=registry)
+def build_token_providers(http_client:HttpClient) -> dict:
+    scopes = OURA_SCOPES.split() if OURA_SCOPES else None
+    token_providers = {}
 
-    if OURA_ACCESS_TOKEN:
-        logger.warning("Using legacy OURA_ACCESS_TOKEN (PAT). Oura recommends OAuth; PATs are being removed.")
-        token_provider = StaticTokenProvider(OURA_ACCESS_TOKEN)
+    if OURA_TOKEN_DIR:
+        if OURA_CLIENT_ID is None:
+            logging.fatal("Missing Oura OAuth config. OURA_TOKEN_DIR requires OURA_CLIENT_ID (and optionally OURA_CLIENT_SECRET).")
+            sys.exit(1)
+        token_providers = load_token_managers(OURA_TOKEN_DIR, OURA_CLIENT_ID, OURA_CLIENT_SECRET, OURA_REDIRECT_URI, scopes, http_client, OURA_TOKEN_URL)
+        logging.info(f"Loaded {len(token_providers)} token files from {OURA_TOKEN_DIR}.")
+    elif OURA_ACCESS_TOKEN:
+        logging.warning("Using legacy OURA_ACCESS_TOKEN (PAT). Oura recommends OAuth; PATs are being removed.")
+        token_providers['default'] = StaticTokenProvider(OURA_ACCESS_TOKEN)
     else:
         if OURA_CLIENT_ID is None:
             logging.fatal("Missing Oura OAuth config. Set OURA_CLIENT_ID (and optionally OURA_CLIENT_SECRET) or keep OURA_ACCESS_TOKEN for legacy use.")
             sys.exit(1)
 
-        scopes = OURA_SCOPES.split() if OURA_SCOPES else None
         initial_auth_code = OURA_AUTH_CODE
         if not initial_auth_code and OURA_AUTH_CODE_FILE:
             try:
@@ -47,93 +109,168 @@ if __name__ == "__main__":
             except OSError as exc:
                 logging.error(f"Failed to read OURA_AUTH_CODE_FILE: {exc}")
 
-        token_provider = OAuthTokenManager(
+        token_providers['default'] = OAuthTokenManager(
             client_id=OURA_CLIENT_ID,
             client_secret=OURA_CLIENT_SECRET,
             redirect_uri=OURA_REDIRECT_URI,
             scopes=scopes,
             token_path=OURA_TOKEN_PATH,
             initial_auth_code=initial_auth_code,
+            http_client=http_client,
+            token_url=OURA_TOKEN_URL,
         )
 
+    return token_providers
+
+STARTUP_RATE_LIMIT_RETRIES = 3
+STARTUP_MAX_RETRY_AFTER = 60.0
+
+def get_personal_info(oura:Oura, name:str):
+    """Fetch personal info at startup, waiting out short rate limits.
+
+    Raises OuraRateLimitError once the retries are used up or `Retry-After` is too long to wait.
+    """
+    for attempt in range(STARTUP_RATE_LIMIT_RETRIES + 1):
+        try:
+            return oura.get_personal_info()
+        except OuraRateLimitError as e:
+            if attempt == STARTUP_RATE_LIMIT_RETRIES or e.retry_after > STARTUP_MAX_RETRY_AFTER:
+                raise
+            logging.warning(f"Oura personal info for {name} is rate limited; retrying in {e.retry_after:.0f}s.")
+            time.sleep(e.retry_after)
+
+def prepare_user(name:str, token_provider, http_client:HttpClient, intervals:dict[str, float], snapshot:SnapshotStore | None = None, history:HistoryStore | None = None) -> OuraUser | None:
     # Trigger OAuth consent early so the server can start only after auth is ready.
     try:
         token_provider.get_access_token()
     except Exception as exc:
-        logging.fatal(f"Failed to prepare Oura authentication: {exc}")
-        sys.exit(1)
+        logging.error(f"Failed to prepare Oura authentication for {name}: {exc}")
+        return None
+
+    oura = Oura(token_provider=token_provider, http_client=http_client, url=OURA_API_URL)
+    try:
+        personal_info = get_personal_info(oura, name)
+    except OuraRateLimitError as e:
+        logging.error(f"Oura rate limited {name} at startup ({e}); skipping this user.")
+        return None
+    if personal_info == None:
+        logging.error(f"Oura authentication failed for {name}. Refresh credentials or re-run OAuth consent.")
+        return None
+    if hasattr(token_provider, "start_refresher"):
+        token_provider.start_refresher()
+    if history != None:
+        oura.history = history.for_user(personal_info.id)
 
-    oura = Oura(token_provider=token_provider)
+    user = OuraUser(
+        name=name,
+        oura=oura,
+        watermarks=SyncWatermarks(
+            initial_days=max(int(SYNC_INITIAL_DAYS), int(EXPORT_DAYS)),
+            overlap_days=int(SYNC_OVERLAP_DAYS),
+            heartrate_overlap=datetime.timedelta(minutes=int(SYNC_HEARTRATE_OVERLAP_MINUTES)),
+        ),
+        scheduler=CategoryScheduler(intervals, jitter=float(POLL_JITTER)),
+        labels=[ personal_info.email ],
+        oura_id=personal_info.id,
+    )
+    if snapshot != None:
+        snapshot.prepare(user)
+    return user
 
-    personal_info = oura.get_personal_info()
+if __name__ == "__main__":
 
-    if personal_info == None:
-        logging.fatal("Oura authentication failed. Refresh credentials or re-run OAuth consent.")
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(level=LOGLEVEL, format='%(asctime)s - %(levelname)s : %(message)s', datefmt="%Y-%m-%dT%H:%M:%S%z")
+
+    metrics_definitions = prom.load_oura_metrics_configs(CONF_FILE)
+
+    registry = CollectorRegistry()
+    telemetry.register(registry)
+
+    # Updates go to the plan registry; scrapes read what was last published from it, or the
+    # scrape collector in pull mode.
+    plan_registry = CollectorRegistry(auto_describe=True)
+    plans = collector.compile_plan(metrics_definitions.categories, plan_registry, max_days=int(EXPORT_DAYS))
+    published = PublishedMetrics(plan_registry)
+    registry.register(published)
+
+    snapshot = None
+    if SNAPSHOT_PATH:
+        snapshot = SnapshotStore(SNAPSHOT_PATH, include_heartrate=SNAPSHOT_HEARTRATE)
+        if snapshot.load():
+            logging.info(f"Restored {snapshot.restore(plans, ORIGIN_TZ)} values from {SNAPSHOT_PATH}.")
+    published.publish()
+
+    exposition = ExpositionCache(registry, max_age=float(METRICS_CACHE_MAX_AGE))
+    if HTTP_PORT:
+        ExpositionServer(int(HTTP_PORT), exposition).start()
+
+    http_client = build_http_client()
+    telemetry.register_http_client(registry, http_client)
+    token_providers = build_token_providers(http_client)
+
+    intervals = { c.name: c.interval if c.interval != None else float(POLL_INTERVAL) for c in metrics_definitions.categories }
+    if WEBHOOK_PORT:
+        # Webhooks announce changes to daily data, so polling those is only a safety net.
+        for name in intervals:
+            if name in collector.DAILY_CATEGORIES:
+                intervals[name] = max(intervals[name], float(WEBHOOK_POLL_INTERVAL))
+
+    history = build_history_store()
+    executor = ThreadPoolExecutor(max_workers=int(FETCH_CONCURRENCY))
+    users = [ u for u in executor.map(lambda name, token_provider: prepare_user(name, token_provider, http_client, intervals, snapshot, history), token_providers.keys(), token_providers.values()) if u != None ]
+
+    if len(users) == 0:
+        logging.fatal("No Oura user could be authenticated. Refresh credentials or re-run OAuth consent.")
         sys.exit(1)
-    
-    labels = [ personal_info.email ]
-
-    root_metrics = {}
-
-    while True:
-        now = datetime.datetime.now(ORIGIN_TZ)
-        today = now.date()     
-        days_ago = now - datetime.timedelta(days=7)
-        start_date = days_ago.date()
-        
-        for category in metrics_definitions.categories:
-            logging.debug(f"gathering {category.name} data...")
-
-            if not category.name in root_metrics:
-                root_metrics[category.name] = {}
-
-            if category.name == 'daily_activity':
-                metrics = oura.get_daily_activity(start_date, today)
-            elif category.name == 'daily_readiness':
-                metrics = oura.get_daily_readiness(start_date, today)
-            elif category.name == 'daily_resilience':
-                metrics = oura.get_daily_resilience(start_date, today)
-            elif category.name == 'daily_sleep':
-                metrics = oura.get_daily_sleep(start_date, today)
-            elif category.name == 'daily_spo2':
-                metrics = oura.get_daily_spo2(start_date, today)
-            elif category.name == 'daily_stress':
-                metrics = oura.get_daily_stress(start_date, today)
-            elif category.name == 'heartrate':
-                # For heart rate, use a 24-hour window
-                metrics = oura.get_heartrate(now - datetime.timedelta(days=1), now)
-            elif category.name == 'personal_info':
-                metrics = oura.get_personal_info()
-
-            if metrics == None:
-                logging.warning(f"getting {category.name} process was failed.")
-                continue
-            elif category.name != 'personal_info' and len(metrics.data) == 0:
-                logging.warning(f"{category.name} data was not found for date range {start_date} to {today}.")
-                continue
-            
-            if category.name != 'personal_info':
-                latest_metrics = metrics.data[-1]
-                if category.name == 'heartrate':
-                    logging.info(f"Found {len(metrics.data)} {category.name} entries, using latest from {latest_metrics.timestamp}")
-                else:
-                    logging.info(f"Found {len(metrics.data)} {category.name} entries, using latest from {latest_metrics.day}")
-            else:
-                latest_metrics = metrics
-
-            for m in category.metrics:
-                iterator = m.iterator if m.iterator != None else m.name
-                try:
-                    extractor = attrgetter(iterator)
-                    value = extractor(latest_metrics)
-                    logging.debug(f"{category.prefix}{m.name}: {value}")
-                    if not m.name in root_metrics[category.name]:
-                        root_metrics[category.name][m.name] = prom.create_metric_instance(m, registry, category.prefix)
-                    prom.set_metrics(root_metrics[category.name][m.name], labels, value)
-                except Exception as e:
-                    logging.error(f"Error processing metric {m.name}: {e}")
-                    continue
-            logging.info(f"gathering {category.name} metrics successful.")
-
-        logging.info("gathering all metrics successful.")
-        time.sleep(60)
\ No newline at end of file
+
+    def start_webhook_receiver(on_change):
+        receiver = WebhookReceiver(
+            int(WEBHOOK_PORT), users, collector.DAILY_CATEGORIES, on_change,
+            verification_token=WEBHOOK_VERIFICATION_TOKEN,
+            client_secret=OURA_CLIENT_SECRET,
+        )
+        receiver.start()
+        logging.info(f"Receiving Oura webhooks on port {WEBHOOK_PORT}; daily categories are polled every {WEBHOOK_POLL_INTERVAL}s.")
+
+    if PULL_MODE:
+        logging.info("Pull mode enabled; Oura data is fetched when /metrics is scraped.")
+        scrape_collector = ScrapeCollector(
+            users, plans, plan_registry, executor,
+            min_age=intervals, deadline=float(CYCLE_DEADLINE), tz=ORIGIN_TZ, snapshot=snapshot,
+        )
+        registry.unregister(published)
+        registry.register(scrape_collector)
+        exposition.invalidate()
+        if WEBHOOK_PORT:
+            def on_change(user, category_name):
+                scrape_collector.invalidate(user, category_name)
+                exposition.invalidate()
+            start_webhook_receiver(on_change)
+        threading.Event().wait()
+
+    remote_writer = None
+    if REMOTE_WRITE_URL:
+        logging.info(f"Pushing samples to {REMOTE_WRITE_URL} with remote_write.")
+        remote_writer = RemoteWriter(
+            REMOTE_WRITE_URL, http_client,
+            batch_size=int(REMOTE_WRITE_BATCH_SIZE),
+            queue_size=int(REMOTE_WRITE_QUEUE_SIZE),
+            headers={ "Authorization": f"Bearer {REMOTE_WRITE_BEARER_TOKEN}" } if REMOTE_WRITE_BEARER_TOKEN else None,
+            auth=(REMOTE_WRITE_USERNAME, REMOTE_WRITE_PASSWORD) if REMOTE_WRITE_USERNAME else None,
+        )
+
+    dispatcher = Dispatcher(
+        users, plans, executor,
+        concurrency=int(FETCH_CONCURRENCY),
+        per_user_concurrency=int(USER_CONCURRENCY),
+        deadline=float(CYCLE_DEADLINE),
+        tz=ORIGIN_TZ,
+        remote_writer=remote_writer,
+        snapshot=snapshot,
+        published=published,
+        exposition=exposition,
+    )
+    if WEBHOOK_PORT:
+        start_webhook_receiver(lambda user, category_name: user.scheduler.trigger(category_name))
+    dispatcher.run_forever()
@@ -0,0 +1,259 @@
+import dataclasses
+import datetime
+import logging
+import time
+from dataclasses import dataclass, field
+from operator import attrgetter
+from typing import Any, Callable
+
+from prometheus_client import CollectorRegistry
+
+import modules.prometheus as prom
+from modules import telemetry
+from modules.heartrate_store import HeartRateLatest, HeartRateSeries
+from modules.oura import Oura
+from modules.oura_dataclasses import OuraDailyActivity, OuraDailyReadiness, OuraDailyResilience, OuraDailySleep, OuraDailySpo2, OuraDailyStress, set_projection
+from modules.prometheus import OuraCategoryConfig, OuraMetricsConfig
+from modules.sync import SyncWatermarks
+
+logger = logging.getLogger(__name__)
+
+DAILY_CATEGORIES = ('daily_activity', 'daily_readiness', 'daily_resilience', 'daily_sleep', 'daily_spo2', 'daily_stress')
+DAILY_RECORD_CLASSES = {
+    'daily_activity': OuraDailyActivity,
+    'daily_readiness': OuraDailyReadiness,
+    'daily_resilience': OuraDailyResilience,
+    'daily_sleep': OuraDailySleep,
+    'daily_spo2': OuraDailySpo2,
+    'daily_stress': OuraDailyStress,
+}
+# Decoded even when no metric reads them: `id` for documents, `day` for watermarks and sample times.
+PROJECTION_FIELDS = ('id', 'day')
+
+@dataclass
+class MetricPlan:
+    definition: OuraMetricsConfig
+    metric: Any
+    extract: Callable[[Any], Any]
+    setters: dict[tuple, Callable[[Any], None]] = field(default_factory=dict)
+
+    def setter(self, labels:tuple) -> Callable[[Any], None]:
+        setter = self.setters.get(labels)
+        if setter == None:
+            setter = self.setters[labels] = prom.bind_setter(self.metric, labels)
+        return setter
+
+@dataclass
+class CategoryPlan:
+    category: OuraCategoryConfig
+    fetch: Callable[[Oura, datetime.datetime, SyncWatermarks], Any]
+    metrics: list[MetricPlan]
+    # With max_days, every day of the window is exported under a `day` label; `days` holds
+    # the values of the exported days per user label set, for eviction and snapshots.
+    max_days: int = 0
+    days: dict[tuple, dict[datetime.date, dict[str, Any]]] = field(default_factory=dict)
+
+def compile_plan(categories:list[OuraCategoryConfig], registry:CollectorRegistry, max_days:int = 0) -> dict[str, CategoryPlan]:
+    """Resolve metrics.yml once into per-category fetchers, extractors and registered metrics.
+
+    Labelled children are bound lazily per label set and cached, so a collection cycle is a
+    plain extract-and-set loop without attrgetter construction, dict walks or label hashing.
+    Daily records are also limited to the fields the metrics' iterators read, so unused
+    subtrees like `class_5_min` are never converted or kept. With `max_days`, daily metrics
+    get an extra `day` label and export up to that many days instead of the latest record.
+    """
+    plans = {}
+    for category in categories:
+        fetcher = bind_fetcher(category.name)
+        if fetcher == None:
+            logging.warning(f"{category.name} is not a supported category; skipping.")
+            continue
+        per_day = max_days > 0 and category.name in DAILY_CATEGORIES
+        metrics = []
+        for m in category.metrics:
+            definition = dataclasses.replace(m, labels=[*m.labels, 'day']) if per_day else m
+            metric = prom.create_metric_instance(definition, registry, category.prefix)
+            if metric == None:
+                logging.warning(f"{category.prefix}{m.name} has unsupported type {m.type}; skipping.")
+                continue
+            metrics.append(MetricPlan(definition, metric, attrgetter(m.iterator if m.iterator != None else m.name)))
+        if category.name in DAILY_RECORD_CLASSES:
+            paths = [ m.definition.iterator if m.definition.iterator != None else m.definition.name for m in metrics ]
+            set_projection(DAILY_RECORD_CLASSES[category.name], [*PROJECTION_FIELDS, *paths])
+        plans[category.name] = CategoryPlan(category, fetcher, metrics, max_days if per_day else 0)
+    return plans
+
+def bind_fetcher(category_name:str) -> Callable[[Oura, datetime.datetime, SyncWatermarks], Any] | None:
+    """Return a function fetching `category_name` for (oura, now, watermarks), or None if unsupported."""
+    if category_name == 'heartrate':
+        return lambda oura, now, watermarks: oura.get_heartrate(*watermarks.heartrate_window_for(category_name, now))
+    elif category_name == 'personal_info':
+        return lambda oura, now, watermarks: oura.get_personal_info()
+    elif category_name in DAILY_CATEGORIES:
+        method = attrgetter(f'get_{category_name}')
+        return lambda oura, now, watermarks: method(oura)(*watermarks.daily_window(category_name, now))
+    return None
+
+def fetch_category_range(oura:Oura, category_name:str, start_date:datetime.date, end_date:datetime.date, tz:datetime.tzinfo | None):
+    """Fetch a fixed date range, e.g. for backfills; `end_date` is exclusive."""
+    if category_name == 'heartrate':
+        return oura.get_heartrate(
+            datetime.datetime.combine(start_date, datetime.time(), tz),
+            datetime.datetime.combine(end_date, datetime.time(), tz),
+        )
+    elif category_name.startswith('daily_'):
+        metrics = getattr(oura, f'get_{category_name}')(start_date, end_date)
+        if metrics == None:
+            return None
+        # The fetched collection may be cached and handed out again, so filter a copy.
+        return dataclasses.replace(metrics, data=[ r for r in metrics.data if start_date <= r.day < end_date ])
+
+    logging.warning(f"{category_name} can not be fetched by date range.")
+    return None
+
+def fetch_document_day(oura:Oura, category_name:str, document_id:str) -> datetime.date | None:
+    """Look up the `day` of one daily record, e.g. the one a webhook event refers to."""
+    data_class = DAILY_RECORD_CLASSES.get(category_name)
+    if data_class == None:
+        return None
+    record = oura.get_document(category_name, document_id, data_class)
+    return record.day if record != None else None
+
+def record_timestamp(record, tz:datetime.tzinfo | None) -> float:
+    """Sample time of a record: the start of its `day` for daily summaries, else its `timestamp`."""
+    day = getattr(record, 'day', None)
+    if day != None:
+        return datetime.datetime.combine(day, datetime.time(), tz).timestamp()
+    return record.timestamp.timestamp()
+
+def apply_category(plan:CategoryPlan, metrics, labels:list,
+                   heartrate:HeartRateSeries | None = None, samples:list | None = None, tz:datetime.tzinfo | None = None,
+                   values:dict | None = None) -> bool:
+    """Set the category's metrics from the latest record, or from every day for per-day plans.
+
+    When `samples` is given, every value is also appended to it as a
+    (name, labels, value, timestamp ms) tuple dated by the record it came from, with
+    daily records dated to the start of their `day` in `tz`. When `values` is given, it
+    receives every metric's value by metric name, or for per-day plans the values of
+    every exported day by ISO date.
+    """
+    category = plan.category
+    # The window stats of a kept heartrate series move on with time, even when a poll brings no new samples.
+    windows_only = category.name == 'heartrate' and heartrate is not None and metrics != None and len(metrics.data) == 0 and len(heartrate) > 0
+    if metrics == None:
+        logging.warning(f"getting {category.name} process was failed.")
+        return False
+    elif category.name != 'personal_info' and len(metrics.data) == 0 and not windows_only:
+        logging.warning(f"{category.name} data was not found for the requested date range.")
+        return False
+
+    started = time.perf_counter()
+    record = metrics
+    if windows_only:
+        logging.info(f"No new {category.name} entries; updating window stats.")
+        now = datetime.datetime.now(datetime.timezone.utc)
+        heartrate.extend(metrics.data, now)
+        latest_metrics = HeartRateLatest(None, heartrate, now)
+    elif category.name != 'personal_info':
+        latest_metrics = record = metrics.data[-1]
+        if category.name == 'heartrate':
+            logging.info(f"Found {len(metrics.data)} {category.name} entries, using latest from {latest_metrics.timestamp}")
+            if heartrate is not None:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                heartrate.extend(metrics.data, now)
+                latest_metrics = HeartRateLatest(latest_metrics, heartrate, now)
+        else:
+            logging.info(f"Found {len(metrics.data)} {category.name} entries, using latest from {latest_metrics.day}")
+    else:
+        latest_metrics = metrics
+
+    label_values = tuple(labels)
+    if plan.max_days:
+        today = datetime.datetime.now(tz).date()
+        cutoff = today - datetime.timedelta(days=plan.max_days - 1)
+        exported = plan.days.setdefault(label_values, {})
+        # Records are ordered by day, so a revision later in the response wins.
+        records = { r.day: r for r in metrics.data if cutoff <= r.day <= today }
+        targets = [ (r, r, label_values + (day.isoformat(),), exported.setdefault(day, {})) for day, r in sorted(records.items()) ]
+    else:
+        targets = [ (latest_metrics, record, label_values, values) ]
+
+    for source, record, series_labels, series_values in targets:
+        if samples is not None:
+            if hasattr(record, 'day') or hasattr(record, 'timestamp'):
+                timestamp_ms = int(record_timestamp(record, tz) * 1000)
+            else:
+                timestamp_ms = int(datetime.datetime.now().timestamp() * 1000)
+        for m in plan.metrics:
+            try:
+                value = m.extract(source)
+                m.setter(series_labels)(value)
+                if series_values is not None:
+                    series_values[m.definition.name] = value
+                if samples is not None:
+                    samples.extend( (name, l, v, timestamp_ms) for name, l, v in prom.metric_samples(m.definition, category.prefix, dict(zip(m.definition.labels, series_labels)), value) )
+            except Exception as e:
+                logging.error(f"Error processing metric {m.definition.name}: {e}")
+                continue
+    if plan.max_days:
+        expire_days(plan, labels, today)
+        if values is not None:
+            values.update({ day.isoformat(): dict(v) for day, v in plan.days[label_values].items() })
+    telemetry.update_duration.labels(category.name).observe(time.perf_counter() - started)
+    logging.info(f"gathering {category.name} metrics successful.")
+    return True
+
+def expire_days(plan:CategoryPlan, labels:list, today:datetime.date) -> bool:
+    """Remove the `day` series of a per-day plan that fell out of its last `max_days` days.
+
+    Returns whether anything was removed.
+    """
+    exported = plan.days.get(tuple(labels))
+    if not plan.max_days or not exported:
+        return False
+    cutoff = today - datetime.timedelta(days=plan.max_days - 1)
+    expired = [ day for day in exported if day < cutoff ]
+    for day in expired:
+        series_labels = (*labels, day.isoformat())
+        for m in plan.metrics:
+            m.metric.remove(*series_labels)
+            m.setters.pop(series_labels, None)
+        del exported[day]
+    return len(expired) > 0
+
+def restore_values(plan:CategoryPlan, labels:list, values:dict[str, Any], today:datetime.date) -> int:
+    """Set metrics from values saved by `apply_category`; returns the number of values set."""
+    label_values = tuple(labels)
+    if plan.max_days:
+        cutoff = today - datetime.timedelta(days=plan.max_days - 1)
+        targets = []
+        for day_name, day_values in values.items():
+            try:
+                day = datetime.date.fromisoformat(day_name)
+            except ValueError:
+                continue  # saved without per-day export
+            if cutoff <= day <= today and isinstance(day_values, dict):
+                plan.days.setdefault(label_values, {})[day] = dict(day_values)
+                targets.append((label_values + (day_name,), day_values))
+    else:
+        targets = [ (label_values, values) ]
+
+    restored = 0
+    for series_labels, series_values in targets:
+        for m in plan.metrics:
+            value = series_values.get(m.definition.name)
+            if value == None:
+                continue
+            try:
+                m.setter(series_labels)(value)
+                restored += 1
+            except Exception as e:
+                logging.warning(f"Could not restore {m.definition.name}: {e}")
+    return restored
+
+def newest_record_timestamp(metrics, tz:datetime.tzinfo | None) -> float | None:
+    """Sample time of the newest record in a collection response, None for other payloads."""
+    data = getattr(metrics, 'data', None)
+    if not data:
+        return None
+    return record_timestamp(data[-1], tz)
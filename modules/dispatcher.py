@@ -0,0 +1,191 @@
+import collections
+import concurrent.futures
+import datetime
+import logging
+import time
+
+import modules.collector as collector
+from modules import telemetry
+from modules.exposition import ExpositionCache, PublishedMetrics
+from modules.oura import OuraRateLimitError
+from modules.remote_write import RemoteWriter
+from modules.snapshot import SnapshotStore
+from modules.users import OuraUser
+
+logger = logging.getLogger(__name__)
+
+MAX_WAIT = 1.0
+
+class Dispatcher:
+    """Runs the due categories of every user on one shared worker pool.
+
+    At most `concurrency` fetches are in flight overall and at most `per_user_concurrency`
+    per user. Users are served round-robin, so one slow or busy account cannot starve the
+    others. Fetches that exceed `deadline` are reported, but keep their slot until they
+    finish: a running fetch can not be cancelled, so rescheduling it would only run it twice.
+
+    A category that becomes due again while its fetch is still in flight, e.g. after a
+    webhook, is deferred and fetched once that fetch has completed, so responses for the same
+    user and category are never applied out of order.
+
+    With `published`, changes are made visible to scrapes once all due work is done, or at
+    the latest `deadline` seconds after the first unpublished change.
+    """
+
+    def __init__(
+        self,
+        users: list[OuraUser],
+        plans: dict[str, collector.CategoryPlan],
+        executor: concurrent.futures.Executor,
+        concurrency: int,
+        per_user_concurrency: int,
+        deadline: float,
+        tz: datetime.tzinfo | None = None,
+        remote_writer: RemoteWriter | None = None,
+        snapshot: SnapshotStore | None = None,
+        published: PublishedMetrics | None = None,
+        exposition: ExpositionCache | None = None,
+    ):
+        self.users = users
+        self.plans = plans
+        self.executor = executor
+        self.concurrency = concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.deadline = deadline
+        self.tz = tz
+        self.remote_writer = remote_writer
+        self.snapshot = snapshot
+        self.published = published
+        self.exposition = exposition
+        self._changed_at: float | None = None
+        self._pending = { user.name: collections.deque() for user in users }
+        self._user_in_flight = { user.name: 0 for user in users }
+        self._in_flight: dict[concurrent.futures.Future, tuple[OuraUser, collector.CategoryPlan, float]] = {}
+        self._overdue: set[concurrent.futures.Future] = set()
+        self._deferred: set[tuple[str, str]] = set()
+        self._turn = 0
+
+    def run_forever(self) -> None:
+        while True:
+            self.run_once()
+
+    @property
+    def idle(self) -> bool:
+        """True when nothing is queued or in flight."""
+        return not self._in_flight and not any(self._pending.values())
+
+    def run_once(self) -> None:
+        for user in self.users:
+            for name in user.scheduler.pop_due():
+                if name not in self.plans or name in self._pending[user.name]:
+                    continue
+                if self._is_in_flight(user, name):
+                    self._deferred.add((user.name, name))
+                else:
+                    self._pending[user.name].append(name)
+        self._submit()
+        self._wait()
+        if self._changed_at is not None and (self.idle or time.monotonic() - self._changed_at >= self.deadline):
+            self._publish()
+        if self.snapshot is not None and self.idle:
+            self.snapshot.save(self.users)
+
+    def _changed(self) -> None:
+        if self._changed_at is None:
+            self._changed_at = time.monotonic()
+
+    def _publish(self) -> None:
+        self._changed_at = None
+        if self.published is not None:
+            self.published.publish()
+        if self.exposition is not None:
+            self.exposition.invalidate()
+
+    def _submit(self) -> None:
+        submitted = True
+        while submitted and len(self._in_flight) < self.concurrency:
+            submitted = False
+            for offset in range(len(self.users)):
+                user = self.users[(self._turn + offset) % len(self.users)]
+                pending = self._pending[user.name]
+                if not pending or self._user_in_flight[user.name] >= self.per_user_concurrency:
+                    continue
+                plan = self.plans[pending.popleft()]
+                logging.debug(f"gathering {plan.category.name} data for {user.name}...")
+                now = datetime.datetime.now(self.tz)
+                future = self.executor.submit(plan.fetch, user.oura, now, user.watermarks)
+                self._in_flight[future] = (user, plan, time.monotonic())
+                self._user_in_flight[user.name] += 1
+                self._turn = (self._turn + offset + 1) % len(self.users)
+                submitted = True
+                break
+
+    def _wait(self) -> None:
+        now = time.monotonic()
+        timeout = MAX_WAIT
+        for user in self.users:
+            next_due = user.scheduler.next_due()
+            if next_due is not None:
+                timeout = min(timeout, max(next_due - now, 0.0))
+
+        if not self._in_flight:
+            time.sleep(timeout)
+            return
+
+        done, _ = concurrent.futures.wait(self._in_flight, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            self._complete(future)
+
+        now = time.monotonic()
+        for future, (user, plan, started) in self._in_flight.items():
+            if now - started > self.deadline and future not in self._overdue:
+                logging.warning(f"getting {plan.category.name} for {user.name} did not finish within {self.deadline}s.")
+                self._overdue.add(future)
+
+    def _complete(self, future: concurrent.futures.Future) -> None:
+        user, plan, started = self._release(future)
+        category = plan.category
+        retry_after = None
+        try:
+            metrics = future.result()
+        except OuraRateLimitError as e:
+            logging.warning(f"getting {category.name} for {user.name} was rate limited: {e}")
+            retry_after = e.retry_after
+        except Exception as e:
+            logging.error(f"getting {category.name} for {user.name} raised an error: {e}")
+        else:
+            samples = [] if self.remote_writer is not None else None
+            values = {} if self.snapshot is not None else None
+            if metrics is not None and metrics is user.applied.get(category.name):
+                logging.debug(f"{category.name} for {user.name} is unchanged; skipping update.")
+                telemetry.payloads.labels(category.name, "unchanged").inc()
+                telemetry.last_success.labels(user.name, category.name).set_to_current_time()
+                if collector.expire_days(plan, user.labels, datetime.datetime.now(self.tz).date()):
+                    self._changed()
+            elif collector.apply_category(plan, metrics, user.labels, user.heartrate, samples, self.tz, values):
+                user.applied[category.name] = metrics
+                if values is not None:
+                    self.snapshot.record(user, category.name, values)
+                user.watermarks.update(category.name, metrics)
+                telemetry.payloads.labels(category.name, "changed").inc()
+                telemetry.cycle_duration.labels(category.name).observe(time.monotonic() - started)
+                telemetry.last_success.labels(user.name, category.name).set_to_current_time()
+                newest = collector.newest_record_timestamp(metrics, self.tz)
+                if newest is not None:
+                    telemetry.latest_record.labels(user.name, category.name).set(newest)
+                if samples:
+                    self.remote_writer.submit(samples)
+                self._changed()
+        user.scheduler.reschedule(category.name, retry_after)
+        if (user.name, category.name) in self._deferred:
+            self._deferred.discard((user.name, category.name))
+            user.scheduler.trigger(category.name)
+
+    def _is_in_flight(self, user: OuraUser, name: str) -> bool:
+        return any(u is user and plan.category.name == name for u, plan, _ in self._in_flight.values())
+
+    def _release(self, future: concurrent.futures.Future) -> tuple[OuraUser, collector.CategoryPlan, float]:
+        entry = self._in_flight.pop(future)
+        self._overdue.discard(future)
+        self._user_in_flight[entry[0].name] -= 1
+        return entry
@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.exposition import choose_encoder, gzip_accepted
+from prometheus_client.registry import Collector
+
+from modules import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 30.0
+GZIP_LEVEL = 6
+
+@dataclass(slots=True, frozen=True)
+class RenderedExposition:
+    content_type: str
+    body: bytes
+    gzipped: bytes
+    etag: str
+    generation: int
+    rendered_at: float
+
+class PublishedMetrics(Collector):
+    """Serves the metric families of the last published cycle while the next one is built.
+
+    Updates go to the metrics in `registry`, which scrapes never read directly. `publish`
+    collects them into a new tuple and swaps it in with one assignment, so every scrape sees
+    a complete cycle and `collect` needs no locks.
+    """
+
+    def __init__(self, registry: CollectorRegistry):
+        self.registry = registry
+        self._families: tuple = ()
+
+    def publish(self) -> None:
+        self._families = tuple(self.registry.collect())
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        return self._families
+
+class ExpositionCache:
+    """Renders the registry once per change and keeps the bytes for every scrape until the next one.
+
+    `invalidate` marks the data as changed; the next scrape of each format renders it again,
+    together with a gzip copy and an ETag. Self-metrics change without an `invalidate`, so a
+    rendering is also replaced once it is older than `max_age` seconds. Concurrent scrapes of a
+    stale format wait for a single rendering instead of each walking the registry.
+    """
+
+    def __init__(self, registry: CollectorRegistry, max_age: float = DEFAULT_MAX_AGE):
+        self.registry = registry
+        self.max_age = max_age
+        self._generation = 0
+        self._rendered: dict[str, RenderedExposition] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    def get(self, accept_header: str | None) -> RenderedExposition:
+        encoder, content_type = choose_encoder(accept_header)
+        rendered = self._rendered.get(content_type)
+        if rendered is not None and self._fresh(rendered):
+            return rendered
+        with self._lock:
+            rendered = self._rendered.get(content_type)
+            if rendered is not None and self._fresh(rendered):
+                return rendered
+            generation = self._generation
+            started = time.perf_counter()
+            body = encoder(self.registry)
+            rendered = RenderedExposition(
+                content_type=content_type,
+                body=body,
+                gzipped=gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+                etag=hashlib.blake2b(body, digest_size=16).hexdigest(),
+                generation=generation,
+                rendered_at=time.monotonic(),
+            )
+            telemetry.render_duration.labels(content_type.split(";")[0]).observe(time.perf_counter() - started)
+            self._rendered[content_type] = rendered
+            return rendered
+
+    def _fresh(self, rendered: RenderedExposition) -> bool:
+        return rendered.generation == self._generation and time.monotonic() - rendered.rendered_at < self.max_age
+
+class ExpositionServer:
+    """Serves /metrics from an ExpositionCache, answering `If-None-Match` with 304."""
+
+    def __init__(self, port: int, cache: ExpositionCache):
+        self.cache = cache
+        self.server = ThreadingHTTPServer(("", port), self._handler())
+        self.server.daemon_threads = True
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="exposition-server", daemon=True).start()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        cache = self.cache
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/favicon.ico":
+                    self._reply(200, b"")
+                    return
+                try:
+                    rendered = cache.get(self.headers.get("Accept"))
+                except Exception as e:
+                    logging.error(f"Rendering metrics failed: {e}")
+                    self._reply(500, b"")
+                    return
+                compressed = gzip_accepted(self.headers.get("Accept-Encoding", ""))
+                # The gzip copy is a different representation, so it gets its own validator.
+                etag = f'"{rendered.etag}-gzip"' if compressed else f'"{rendered.etag}"'
+                headers = { "Content-Type": rendered.content_type, "ETag": etag, "Vary": "Accept, Accept-Encoding" }
+                if etag in (t.strip() for t in self.headers.get("If-None-Match", "").split(",")):
+                    self._reply(304, b"", headers)
+                    return
+                if compressed:
+                    headers["Content-Encoding"] = "gzip"
+                self._reply(200, rendered.gzipped if compressed else rendered.body, headers)
+
+            def _reply(self, status: int, body: bytes, headers: dict | None = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if status != 304:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
@@ -0,0 +1,146 @@
+import base64
+import bisect
+import datetime
+import functools
+import math
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Iterable
+
+from modules.oura_dataclasses import OuraHeartRate
+
+SOURCES = ("awake", "rest", "sleep", "session", "live", "workout")
+SOURCE_CODES = { name: code for code, name in enumerate(SOURCES) }
+UNKNOWN_SOURCE = 255
+RETENTION = datetime.timedelta(hours=24)
+
+@dataclass(slots=True)
+class HeartRateWindowStats:
+    # An empty window reads as NaN rather than None, so its gauges stop showing the last
+    # window that had samples.
+    count: int
+    min: float = math.nan
+    max: float = math.nan
+    mean: float = math.nan
+    p50: float = math.nan
+    p95: float = math.nan
+
+
+class HeartRateSeries:
+    """Compact in-memory heartrate time series.
+
+    Samples are kept in parallel typed arrays (int64 epoch seconds, uint16 bpm, uint8 source code)
+    ordered by timestamp, so a day of 5 second samples costs about 190 KiB instead of a list of
+    dataclasses. Samples older than `retention` are evicted on every append.
+    """
+
+    def __init__(self, retention: datetime.timedelta = RETENTION):
+        self.retention = retention
+        self.timestamps = array("q")
+        self.bpm = array("H")
+        self.sources = array("B")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def extend(self, samples: Iterable[OuraHeartRate], now: datetime.datetime) -> int:
+        """Append samples newer than the latest stored one and evict expired ones; returns the number appended."""
+        appended = 0
+        with self._lock:
+            last = self.timestamps[-1] if self.timestamps else None
+            for sample in samples:
+                ts = int(sample.timestamp.timestamp())
+                if last is not None and ts <= last:
+                    continue  # already stored by an overlapping request
+                self.timestamps.append(ts)
+                self.bpm.append(sample.bpm)
+                self.sources.append(SOURCE_CODES.get(sample.source, UNKNOWN_SOURCE))
+                last = ts
+                appended += 1
+            self._evict(int((now - self.retention).timestamp()))
+        return appended
+
+    def dump(self) -> dict:
+        """Serialize the stored samples as base64 of the raw arrays."""
+        with self._lock:
+            return {
+                name: base64.b64encode(getattr(self, name).tobytes()).decode()
+                for name in ("timestamps", "bpm", "sources")
+            }
+
+    def load(self, dumped: dict, now: datetime.datetime) -> None:
+        """Replace the stored samples with ones from `dump`, dropping those already expired."""
+        arrays = {}
+        for name in ("timestamps", "bpm", "sources"):
+            arrays[name] = array(getattr(self, name).typecode)
+            arrays[name].frombytes(base64.b64decode(dumped[name]))
+        if not len(arrays["timestamps"]) == len(arrays["bpm"]) == len(arrays["sources"]):
+            raise ValueError("heartrate arrays differ in length")
+        with self._lock:
+            self.timestamps, self.bpm, self.sources = arrays["timestamps"], arrays["bpm"], arrays["sources"]
+            self._evict(int((now - self.retention).timestamp()))
+
+    def window_bpm(self, window: datetime.timedelta, now: datetime.datetime) -> array:
+        with self._lock:
+            start = bisect.bisect_left(self.timestamps, int((now - window).timestamp()))
+            return self.bpm[start:]
+
+    def window_stats(self, window: datetime.timedelta, now: datetime.datetime) -> HeartRateWindowStats:
+        values = sorted(self.window_bpm(window, now))
+        if not values:
+            return HeartRateWindowStats(count=0)
+        return HeartRateWindowStats(
+            count=len(values),
+            min=values[0],
+            max=values[-1],
+            mean=sum(values) / len(values),
+            p50=_percentile(values, 0.5),
+            p95=_percentile(values, 0.95),
+        )
+
+    def _evict(self, cutoff: int) -> None:
+        expired = bisect.bisect_left(self.timestamps, cutoff)
+        if expired:
+            del self.timestamps[:expired]
+            del self.bpm[:expired]
+            del self.sources[:expired]
+
+
+class HeartRateLatest:
+    """Latest heartrate record plus window aggregates, as seen by metrics.yml iterators.
+
+    `bpm`, `source` and `timestamp` resolve to the latest sample; `window_5m`, `window_1h` and
+    `window_24h` resolve to HeartRateWindowStats computed once per cycle from the series, and
+    `samples_24h` to the raw bpm values for histogram and summary metrics. Without a
+    `latest` sample, only the window aggregates are set.
+    """
+
+    def __init__(self, latest: OuraHeartRate | None, series: HeartRateSeries, now: datetime.datetime):
+        self.bpm = latest.bpm if latest is not None else None
+        self.source = latest.source if latest is not None else None
+        self.timestamp = latest.timestamp if latest is not None else None
+        self._series = series
+        self._now = now
+
+    @functools.cached_property
+    def window_5m(self) -> HeartRateWindowStats:
+        return self._series.window_stats(datetime.timedelta(minutes=5), self._now)
+
+    @functools.cached_property
+    def window_1h(self) -> HeartRateWindowStats:
+        return self._series.window_stats(datetime.timedelta(hours=1), self._now)
+
+    @functools.cached_property
+    def window_24h(self) -> HeartRateWindowStats:
+        return self._series.window_stats(datetime.timedelta(hours=24), self._now)
+
+    @property
+    def samples_24h(self) -> array:
+        return self._series.window_bpm(datetime.timedelta(hours=24), self._now)
+
+def _percentile(sorted_values: list[int], q: float) -> int:
+    # Nearest-rank percentile.
+    rank = max(math.ceil(q * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
@@ -0,0 +1,186 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+from modules import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTLE_DAYS = 2
+DEFAULT_HEARTRATE_SETTLE = datetime.timedelta(hours=24)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    user TEXT NOT NULL, category TEXT NOT NULL, day TEXT NOT NULL, id TEXT, data TEXT NOT NULL,
+    PRIMARY KEY (user, category, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS heartrate (
+    user TEXT NOT NULL, ts INTEGER NOT NULL, bpm INTEGER NOT NULL, source TEXT NOT NULL,
+    PRIMARY KEY (user, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    user TEXT NOT NULL, category TEXT NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL,
+    PRIMARY KEY (user, category, start)
+) WITHOUT ROWID;
+"""
+
+class HistoryStore:
+    """SQLite file keeping every record fetched from Oura, by user, category and day or timestamp.
+
+    Daily records are stored as their JSON, heartrate samples as rows. Besides the records, the
+    store keeps which ranges were fetched completely once they are settled, i.e. older than
+    `settle_days` (daily) or `heartrate_settle` (heartrate), since Oura still adds to and revises
+    recent data when the ring syncs. Days are settled by today's date in `tz`, like the
+    collection loops. Requests for settled, covered ranges are answered from the file instead of
+    the API; see `UserHistory`.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        settle_days: int = DEFAULT_SETTLE_DAYS,
+        heartrate_settle: datetime.timedelta = DEFAULT_HEARTRATE_SETTLE,
+        tz: datetime.tzinfo | None = None,
+    ):
+        self.path = Path(path).expanduser()
+        self.settle_days = settle_days
+        self.heartrate_settle = heartrate_settle
+        self.tz = tz
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def for_user(self, user: str) -> "UserHistory":
+        return UserHistory(self, user)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def save(self, user: str, category: str, items: list[dict]) -> None:
+        """Upsert raw API records of a category; items without a `day` or `timestamp` are ignored."""
+        if category == 'heartrate':
+            rows = [
+                (user, int(datetime.datetime.fromisoformat(i["timestamp"]).timestamp()), i["bpm"], i.get("source") or "")
+                for i in items if i.get("timestamp") and i.get("bpm") is not None
+            ]
+            statement = "INSERT OR REPLACE INTO heartrate VALUES (?, ?, ?, ?)"
+        else:
+            rows = [ (user, category, i["day"], i.get("id"), json.dumps(i, separators=(",", ":"))) for i in items if i.get("day") ]
+            statement = "INSERT OR REPLACE INTO daily VALUES (?, ?, ?, ?, ?)"
+        if not rows:
+            return
+        with self._lock, self._db:
+            self._db.executemany(statement, rows)
+        telemetry.history_records.labels(category, "stored").inc(len(rows))
+
+    def daily(self, user: str, category: str, start: datetime.date, end: datetime.date) -> list[dict]:
+        """Stored records of a daily category from `start` to `end`, inclusive, ordered by day."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM daily WHERE user = ? AND category = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user, category, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        telemetry.history_records.labels(category, "served").inc(len(rows))
+        return [ json.loads(data) for data, in rows ]
+
+    def heartrate(self, user: str, start: datetime.datetime, end: datetime.datetime) -> list[dict]:
+        """Stored heartrate samples in [`start`, `end`), ordered by time, shaped like API records."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT ts, bpm, source FROM heartrate WHERE user = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (user, int(start.timestamp()), int(end.timestamp())),
+            ).fetchall()
+        telemetry.history_records.labels("heartrate", "served").inc(len(rows))
+        return [
+            { "bpm": bpm, "source": source, "timestamp": datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat() }
+            for ts, bpm, source in rows
+        ]
+
+    def covered_until(self, user: str, category: str, start: int, end: int) -> int:
+        """End of the covered run starting at `start`, capped at `end`; `start` when none is covered.
+
+        Ranges are half-open: day ordinals for daily categories, Unix seconds for heartrate.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT end FROM coverage WHERE user = ? AND category = ? AND start <= ? AND end > ? ORDER BY start DESC LIMIT 1",
+                (user, category, start, start),
+            ).fetchone()
+        return min(row[0], end) if row else start
+
+    def cover(self, user: str, category: str, start: int, end: int) -> None:
+        """Record [`start`, `end`) as completely fetched, merged with overlapping or adjacent ranges."""
+        if start >= end:
+            return
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT start, end FROM coverage WHERE user = ? AND category = ? AND start <= ? AND end >= ?",
+                (user, category, end, start),
+            ).fetchall()
+            for row_start, row_end in rows:
+                start, end = min(start, row_start), max(end, row_end)
+            self._db.execute(
+                "DELETE FROM coverage WHERE user = ? AND category = ? AND start <= ? AND end >= ?",
+                (user, category, end, start),
+            )
+            self._db.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (user, category, start, end))
+
+class UserHistory:
+    """A HistoryStore bound to one Oura user, as used by `Oura` to split requests.
+
+    A window is split into the settled, covered run at its start, read from the store, and the
+    rest, fetched from the API. The fetched part is stored and, as far as it is settled, marked
+    as covered.
+    """
+
+    def __init__(self, store: HistoryStore, user: str):
+        self.store = store
+        self.user = user
+
+    def save(self, category: str, items: list[dict]) -> None:
+        try:
+            self.store.save(self.user, category, items)
+        except (sqlite3.Error, KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Could not store {category} records: {e}")
+
+    def daily_split(self, category: str, start: datetime.date, end: datetime.date) -> tuple[list[dict], datetime.date]:
+        """Stored records of the covered days from `start`, and the first day still to fetch."""
+        settled = self._settled_day()
+        covered = self.store.covered_until(self.user, category, start.toordinal(), min(end, settled).toordinal() + 1)
+        fetch_start = datetime.date.fromordinal(max(covered, start.toordinal()))
+        if fetch_start == start:
+            return [], start
+        return self.store.daily(self.user, category, start, fetch_start - datetime.timedelta(days=1)), fetch_start
+
+    def daily_fetched(self, category: str, start: datetime.date, end: datetime.date) -> None:
+        settled = self._settled_day()
+        self._cover(category, start.toordinal(), min(end, settled).toordinal() + 1)
+
+    def heartrate_split(self, start: datetime.datetime, end: datetime.datetime) -> tuple[list[dict], datetime.datetime]:
+        """Stored samples of the covered time from `start`, and the time to fetch from."""
+        settled = datetime.datetime.now(datetime.timezone.utc) - self.store.heartrate_settle
+        covered = self.store.covered_until(self.user, 'heartrate', int(start.timestamp()), int(min(end, settled).timestamp()))
+        if covered <= int(start.timestamp()):
+            return [], start
+        fetch_start = datetime.datetime.fromtimestamp(covered, start.tzinfo)
+        return self.store.heartrate(self.user, start, fetch_start), fetch_start
+
+    def heartrate_fetched(self, start: datetime.datetime, end: datetime.datetime) -> None:
+        settled = datetime.datetime.now(datetime.timezone.utc) - self.store.heartrate_settle
+        self._cover('heartrate', int(start.timestamp()), int(min(end, settled).timestamp()))
+
+    def _settled_day(self) -> datetime.date:
+        return datetime.datetime.now(self.store.tz).date() - datetime.timedelta(days=self.store.settle_days)
+
+    def _cover(self, category: str, start: int, end: int) -> None:
+        try:
+            self.store.cover(self.user, category, start, end)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not record {category} coverage: {e}")
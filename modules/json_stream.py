@@ -0,0 +1,101 @@
+"""Incremental parsing of `{"data": [...], ...}` response bodies.
+
+Only one element of the array is held as Python objects at a time, and the body text is
+trimmed as elements are consumed, so memory stays proportional to a record instead of the
+whole response. Other top-level members, like `next_token`, are collected into a dict.
+"""
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+TRIM_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+class _Reader:
+    def __init__(self, chunks:Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> bool:
+        if self.eof:
+            return False
+        if self.pos > TRIM_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            text = self.utf8.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.utf8.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it ('' at the end)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ""
+
+    def expect(self, chars:str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._read():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk.
+            if NUMBER_CHARS.issuperset(self.buffer[end:end + 32]) and self._read():
+                continue
+            self.pos = end
+            return value
+
+def iter_array_items(chunks:Iterable[bytes], key:str = "data", rest:dict | None = None) -> Iterator[Any]:
+    """Yield the elements of the top-level array `key` while the body is still being read.
+
+    Members other than `key` are stored in `rest` once the generator is exhausted. Raises
+    `json.JSONDecodeError` on malformed or truncated bodies.
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            value = reader.value()
+            if rest is not None:
+                rest[name] = value
+        if reader.expect(",}") == "}":
+            break
+    if reader.peek():
+        raise json.JSONDecodeError("Extra data", reader.buffer, reader.pos)
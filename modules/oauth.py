@@ -2,21 +2,30 @@ import base64
 import hashlib
 import json
 import logging
+import os
 import secrets
+import tempfile
+import threading
 import urllib.parse
 import sys
+import time
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Iterable
 
 import requests
 
+from modules import telemetry
+from modules.http_client import HttpClient
+
 logger = logging.getLogger(__name__)
 
 AUTH_URL = "https://cloud.ouraring.com/oauth/authorize"
 TOKEN_URL = "https://api.ouraring.com/oauth/token"
 DEFAULT_SCOPES = ["email", "personal", "daily", "heartrate", "spo2", "stress"]
 TOKEN_EXPIRY_MARGIN = timedelta(seconds=30)
+REFRESH_LEAD = timedelta(minutes=5)
+REFRESH_RETRY = 60.0
 
 
 class StaticTokenProvider:
@@ -28,12 +37,17 @@ class StaticTokenProvider:
     def get_access_token(self, force_refresh: bool = False) -> str:  # noqa: ARG002
         return self.token
 
-    def refresh_access_token(self) -> bool:
+    def refresh_access_token(self, rejected_token: str | None = None) -> bool:  # noqa: ARG002
         return False
 
 
 class OAuthTokenManager:
-    """Handles Oura OAuth2 Authorization Code + PKCE flow with persisted tokens."""
+    """Handles Oura OAuth2 Authorization Code + PKCE flow with persisted tokens.
+
+    Safe to share between threads: refreshes run one at a time behind a lock, callers that
+    saw the same token rejected share a single refresh, and `start_refresher` renews the
+    token in the background shortly before it expires. The token file is replaced atomically.
+    """
 
     def __init__(
         self,
@@ -44,8 +58,11 @@ class OAuthTokenManager:
         token_path: str | Path | None = None,
         initial_auth_code: str | None = None,
         stdin_is_interactive: bool | None = None,
+        http_client: HttpClient | None = None,
+        token_url: str = TOKEN_URL,
     ):
         self.client_id = client_id
+        self.token_url = token_url
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.scopes = list(scopes) if scopes else DEFAULT_SCOPES
@@ -61,25 +78,61 @@ class OAuthTokenManager:
         self.stdin_is_interactive = (
             sys.stdin.isatty() if stdin_is_interactive is None else stdin_is_interactive
         )
+        self.http = http_client if http_client is not None else HttpClient()
+        self._lock = threading.RLock()
+        self._refresher: threading.Thread | None = None
 
     def get_access_token(self, force_refresh: bool = False) -> str:
-        if self.token and not force_refresh and not self._token_expired(self.token):
-            return self.token["access_token"]
+        token = self.token
+        if token and not force_refresh and not self._token_expired(token):
+            return token["access_token"]
 
-        if self.token and self.token.get("refresh_token"):
-            if self.refresh_access_token():
+        with self._lock:
+            # Another thread may have refreshed while this one waited for the lock.
+            if self.token and not self._token_expired(self.token) and (not force_refresh or self.token is not token):
                 return self.token["access_token"]
-            logger.warning("Refresh token failed; falling back to new authorization flow.")
 
-        if not self.client_id:
-            raise RuntimeError("Oura client_id is missing. Set OURA_CLIENT_ID.")
+            if self.token and self.token.get("refresh_token"):
+                if self._refresh():
+                    return self.token["access_token"]
+                logger.warning("Refresh token failed; falling back to new authorization flow.")
+
+            if not self.client_id:
+                raise RuntimeError("Oura client_id is missing. Set OURA_CLIENT_ID.")
 
-        self._interactive_authorization()
-        if not self.token:
-            raise RuntimeError("Authorization did not yield an access token.")
-        return self.token["access_token"]
+            self._interactive_authorization()
+            if not self.token:
+                raise RuntimeError("Authorization did not yield an access token.")
+            return self.token["access_token"]
 
-    def refresh_access_token(self) -> bool:
+    def refresh_access_token(self, rejected_token: str | None = None) -> bool:
+        """Refresh the access token; with `rejected_token`, skip it if that token was already replaced."""
+        with self._lock:
+            if rejected_token and self.token and self.token.get("access_token") != rejected_token:
+                logger.debug("Access token was already refreshed by another request.")
+                return True
+            return self._refresh()
+
+    def start_refresher(self, lead: timedelta = REFRESH_LEAD) -> None:
+        """Renew the token in a background thread `lead` before it expires."""
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, args=(lead,), name="oauth-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self, lead: timedelta) -> None:
+        while True:
+            delay = self._seconds_until_expiry(self.token) - lead.total_seconds()
+            time.sleep(max(delay, 0.0))
+            with self._lock:
+                if self._seconds_until_expiry(self.token) > lead.total_seconds():
+                    continue  # refreshed on demand meanwhile
+                refreshed = self._refresh()
+            if not refreshed:
+                logger.warning("Background token refresh failed; retrying in %.0fs.", REFRESH_RETRY)
+                time.sleep(REFRESH_RETRY)
+
+    def _refresh(self) -> bool:
         if not self.token or not self.token.get("refresh_token"):
             return False
 
@@ -127,17 +180,24 @@ class OAuthTokenManager:
         return self._request_token(payload)
 
     def _request_token(self, payload: dict) -> dict | None:
+        grant_type = payload.get("grant_type", "unknown")
+        started = time.perf_counter()
+        token = self._post_token(payload)
+        telemetry.token_request_duration.labels(grant_type).observe(time.perf_counter() - started)
+        telemetry.token_requests.labels(grant_type, "success" if token else "failure").inc()
+        return token
+
+    def _post_token(self, payload: dict) -> dict | None:
         data = {"client_id": self.client_id, **payload}
         auth = None
         if self.client_secret:
             auth = (self.client_id, self.client_secret)
 
         try:
-            response = requests.post(
-                TOKEN_URL,
+            response = self.http.post(
+                self.token_url,
                 data=data,
                 auth=auth,
-                timeout=15,
             )
         except requests.exceptions.RequestException as exc:
             logger.error("Token endpoint request failed: %s", exc)
@@ -158,14 +218,18 @@ class OAuthTokenManager:
             return None
 
     def _token_expired(self, token: dict) -> bool:
-        expires_at = token.get("expires_at")
+        return self._seconds_until_expiry(token) <= TOKEN_EXPIRY_MARGIN.total_seconds()
+
+    @staticmethod
+    def _seconds_until_expiry(token: dict | None) -> float:
+        expires_at = token.get("expires_at") if token else None
         if not expires_at:
-            return True
+            return 0.0
         try:
             expiry = datetime.fromisoformat(expires_at)
         except ValueError:
-            return True
-        return expiry <= datetime.now(timezone.utc) + TOKEN_EXPIRY_MARGIN
+            return 0.0
+        return (expiry - datetime.now(timezone.utc)).total_seconds()
 
     def _store_token(self, token_payload: dict) -> None:
         expires_in = token_payload.get("expires_in")
@@ -185,12 +249,17 @@ class OAuthTokenManager:
         }
 
         self.token_path.parent.mkdir(parents=True, exist_ok=True)
-        with self.token_path.open("w", encoding="utf-8") as fp:
-            json.dump(self.token, fp, indent=2)
+        # mkstemp creates the file with 0600, and the rename never exposes a partial token file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.token_path.parent, prefix=f".{self.token_path.name}.", suffix=".tmp")
         try:
-            self.token_path.chmod(0o600)
-        except OSError:
-            logger.debug("Could not adjust permissions for %s", self.token_path)
+            with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                json.dump(self.token, fp, indent=2)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, self.token_path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
         self._clear_pending_auth()
 
     def _load_token(self) -> dict | None:
@@ -1,111 +1,420 @@
 import datetime
+import email.utils
+import hashlib
 import logging
-from typing import Any
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterator
 
 import requests
-from dacite import Config, from_dict
 
+from modules import json_stream, telemetry
+from modules.history import UserHistory
+from modules.http_client import HttpClient
 from modules.oura_dataclasses import *
 
 logger = logging.getLogger(__name__)
 
+API_URL = "https://api.ouraring.com/v2"
+MAX_PAGES = 100
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_RETRY_AFTER = 60.0
+HISTORY_BATCH_SIZE = 1000
+
+class _PageFailed(Exception):
+    pass
+
+class OuraRateLimitError(Exception):
+    """Raised when the Oura API answers 429 Too Many Requests."""
+
+    def __init__(self, path: str, retry_after: float):
+        super().__init__(f"{path} was rate limited; retry after {retry_after:.0f}s")
+        self.path = path
+        self.retry_after = retry_after
+
+    @staticmethod
+    def parse_retry_after(value: str | None) -> float:
+        if not value:
+            return DEFAULT_RETRY_AFTER
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return DEFAULT_RETRY_AFTER
+        return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+@dataclass(slots=True)
+class CachedPage:
+    params: tuple
+    etag: str | None
+    digest: bytes | None
+    page: Any
+
 class Oura:
 
-    def __init__(self, token_provider: Any):
-        self.url = "https://api.ouraring.com/v2"
+    def __init__(self, token_provider: Any, http_client: HttpClient | None = None, url: str = API_URL, history: UserHistory | None = None):
+        self.url = url.rstrip("/")
         self.token_provider = token_provider
-        self.cast_config = Config({
-            datetime.datetime: datetime.datetime.fromisoformat,
-            datetime.date: datetime.date.fromisoformat,
-        })
+        self.http = http_client if http_client is not None else HttpClient()
+        self.history = history
+        self._pages: dict[tuple[str, int], CachedPage] = {}
+        self._collections: dict[str, tuple[tuple, Any]] = {}
+        self._merged: dict[str, tuple[datetime.date, datetime.date, Any, Any]] = {}
     
     def __call__(self, hook, **kwargs):
         getattr(self, f'get_{hook}')(**kwargs)
 
-    def get_usercollection(self, path:str, **params) -> dict | None:
+    def get_usercollection(self, path:str, document_id:str | None = None, **params) -> dict | None:
         try:
-            response = self._authorized_get(path, params)
+            response = self._authorized_get(path, params, document_id=document_id)
             if response is None:
                 return None
-            return response.json()
+            return self._parse_json(path, response)
         except requests.exceptions.RequestException as e:
             logging.error(f"HTTP Request failed: {e}")
             return None
 
     def get_daily_activity(self, start_date:datetime.date, end_date:datetime.date) -> OuraDailyActivities:
-        res_dict = self.get_usercollection("daily_activity", start_date=start_date.isoformat(), end_date=end_date.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraDailyActivities, data=res_dict, config=self.cast_config)
-        return None
+        return self._get_daily("daily_activity", OuraDailyActivities, start_date, end_date)
 
     def get_daily_readiness(self, start_date:datetime.date, end_date:datetime.date) -> OuraDailyReadinesses:
-        res_dict = self.get_usercollection("daily_readiness", start_date=start_date.isoformat(), end_date=end_date.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraDailyReadinesses, data=res_dict, config=self.cast_config)
-        return None
+        return self._get_daily("daily_readiness", OuraDailyReadinesses, start_date, end_date)
 
     def get_daily_resilience(self, start_date:datetime.date, end_date:datetime.date) -> OuraDailyResiliences:
-        res_dict = self.get_usercollection("daily_resilience", start_date=start_date.isoformat(), end_date=end_date.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraDailyResiliences, data=res_dict, config=self.cast_config)
-        return None
+        return self._get_daily("daily_resilience", OuraDailyResiliences, start_date, end_date)
 
     def get_daily_sleep(self, start_date:datetime.date, end_date:datetime.date) -> OuraDailySleeps:
-        res_dict = self.get_usercollection("daily_sleep", start_date=start_date.isoformat(), end_date=end_date.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraDailySleeps, data=res_dict, config=self.cast_config)
-        return None
+        return self._get_daily("daily_sleep", OuraDailySleeps, start_date, end_date)
 
     def get_daily_spo2(self, start_date:datetime.date, end_date:datetime.date) -> OuraDailySpo2s:
-        res_dict = self.get_usercollection("daily_spo2", start_date=start_date.isoformat(), end_date=end_date.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraDailySpo2s, data=res_dict, config=self.cast_config)
-        return None
+        return self._get_daily("daily_spo2", OuraDailySpo2s, start_date, end_date)
 
     def get_daily_stress(self, start_date:datetime.date, end_date:datetime.date) -> OuraDailyStresses:
-        res_dict = self.get_usercollection("daily_stress", start_date=start_date.isoformat(), end_date=end_date.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraDailyStresses, data=res_dict, config=self.cast_config)
-        return None
+        return self._get_daily("daily_stress", OuraDailyStresses, start_date, end_date)
 
     def get_heartrate(self, start_datetime:datetime.datetime, end_datetime:datetime.datetime) -> OuraHeartRates:
-        res_dict = self.get_usercollection("heartrate", start_datetime=start_datetime.isoformat(), end_datetime=end_datetime.isoformat())
-        if res_dict != None:
-            return from_dict(data_class=OuraHeartRates, data=res_dict, config=self.cast_config)
-        return None
+        if self.history is None:
+            # Heartrate windows move every cycle and feed time-based stats, so they are always decoded.
+            return self._get_collection("heartrate", OuraHeartRates, track_changes=False, start_datetime=start_datetime.isoformat(), end_datetime=end_datetime.isoformat())
+        local, fetch_start = self.history.heartrate_split(start_datetime, end_datetime)
+        decode_record = decoder_for(OuraHeartRate)
+        data = [ decode_record(r) for r in local ]
+        if fetch_start < end_datetime:
+            fetched = self._get_collection("heartrate", OuraHeartRates, track_changes=False, start_datetime=fetch_start.isoformat(), end_datetime=end_datetime.isoformat())
+            if fetched is None:
+                return None
+            self.history.heartrate_fetched(fetch_start, end_datetime)
+            data.extend(fetched.data)
+        return OuraHeartRates(data=data, next_token=None)
 
     def get_personal_info(self) -> OuraPersonalInfo:
-        res_dict = self.get_usercollection("personal_info")
+        fetched = self._fetch_page("personal_info", OuraPersonalInfo, {}, 0, True)
+        return fetched[0] if fetched != None else None
+
+    def get_document(self, path:str, document_id:str, data_class:type):
+        """Fetch a single record of a usercollection endpoint by its id."""
+        res_dict = self.get_usercollection(path, document_id=document_id)
         if res_dict != None:
-            return from_dict(data_class=OuraPersonalInfo, data=res_dict, config=self.cast_config)
+            if self.history is not None:
+                self.history.save(path, [res_dict])
+            return self._decode(path, data_class, res_dict)
         return None
 
-    def _authorized_get(self, path: str, params: dict) -> requests.Response | None:
+    def iter_pages(self, path:str, data_class:type, max_pages:int = MAX_PAGES, prefetch:int = 0, **params) -> Iterator[list]:
+        """Yield the decoded `data` records of a usercollection endpoint page by page, following `next_token`.
+
+        With `prefetch` > 0 up to that many pages are fetched ahead on a background thread while the
+        caller consumes the current one; otherwise the next page is only requested when asked for.
+        Either way the number of pages held in memory is bounded. Stops after `max_pages` pages.
+        """
+        for fetched in self._iter_collection_pages(path, data_class, params, max_pages, prefetch, False):
+            if fetched is None:
+                return
+            yield fetched[0].data
+
+    def iter_records(self, path:str, data_class:type, max_pages:int = MAX_PAGES, prefetch:int = 0, **params) -> Iterator[Any]:
+        """Yield decoded records one at a time.
+
+        Without `prefetch` each response is parsed while it is still being read, so only one
+        record is held at a time instead of the whole page as JSON and as dataclasses.
+        """
+        if prefetch > 0:
+            for records in self.iter_pages(path, data_class, max_pages, prefetch, **params):
+                yield from records
+            return
+        try:
+            yield from self._iter_streamed_records(path, data_class, params, max_pages)
+        except _PageFailed:
+            return
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Streaming {path} failed: {e}")
+
+    def _get_daily(self, path:str, data_class:type, start_date:datetime.date, end_date:datetime.date):
+        """Fetch a daily collection, reading its settled and already fetched days from the history store."""
+        if self.history is None:
+            return self._get_collection(path, data_class, start_date=start_date.isoformat(), end_date=end_date.isoformat())
+        local, fetch_start = self.history.daily_split(path, start_date, end_date)
+        decode_record = decoder_for(record_class(data_class))
+        if fetch_start > end_date:
+            return data_class(data=[ decode_record(r) for r in local ], next_token=None)
+        fetched = self._get_collection(path, data_class, start_date=fetch_start.isoformat(), end_date=end_date.isoformat())
+        if fetched is None:
+            return None
+        self.history.daily_fetched(path, fetch_start, end_date)
+        if not local:
+            return fetched
+        # Keep handing out the same merged object while the fetched part is unchanged, so change tracking still skips it.
+        cached = self._merged.get(path)
+        if cached is not None and cached[:2] == (start_date, fetch_start) and cached[2] is fetched:
+            return cached[3]
+        merged = data_class(data=[ decode_record(r) for r in local ] + fetched.data, next_token=None)
+        self._merged[path] = (start_date, fetch_start, fetched, merged)
+        return merged
+
+    def _get_collection(self, path:str, data_class:type, track_changes:bool = True, **params):
+        """Fetch every page of `path`.
+
+        With `track_changes`, a collection whose pages are all unchanged since the previous call
+        with the same params returns the previous result object itself, so callers can skip it
+        with an `is` check. Calls with other params, e.g. concurrent backfill chunks, never
+        share a result.
+        """
+        if not track_changes:
+            # Nothing to compare against, so decode while reading instead of materializing the JSON first.
+            try:
+                return data_class(data=list(self._iter_streamed_records(path, data_class, params, MAX_PAGES)), next_token=None)
+            except _PageFailed:
+                return None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.error(f"Streaming {path} failed: {e}")
+                return None
+
+        data = []
+        unchanged = True
+        for fetched in self._iter_collection_pages(path, data_class, params, MAX_PAGES, 0, track_changes):
+            if fetched is None:
+                return None
+            page, page_unchanged = fetched
+            data.extend(page.data)
+            unchanged = unchanged and page_unchanged
+        params_key = tuple(sorted(params.items()))
+        cached = self._collections.get(path)
+        if track_changes and unchanged and cached is not None and cached[0] == params_key:
+            return cached[1]
+        result = data_class(data=data, next_token=None)
+        if track_changes:
+            self._collections[path] = (params_key, result)
+        return result
+
+    def _iter_collection_pages(self, path:str, data_class:type, params:dict, max_pages:int, prefetch:int, track_changes:bool) -> Iterator[tuple[Any, bool] | None]:
+        if prefetch > 0:
+            yield from self._prefetch_pages(path, data_class, params, max_pages, prefetch)
+            return
+
+        next_token = None
+        for page_number in range(max_pages):
+            page_params = dict(params, next_token=next_token) if next_token else params
+            fetched = self._fetch_page(path, data_class, page_params, page_number, track_changes)
+            yield fetched
+            if fetched is None:
+                return
+            next_token = fetched[0].next_token
+            if not next_token:
+                return
+        logging.warning(f"{path} has more than {max_pages} pages; remaining pages were not fetched.")
+
+    def _iter_streamed_records(self, path:str, data_class:type, params:dict, max_pages:int) -> Iterator[Any]:
+        """Yield the records of every page as they are parsed; raises _PageFailed on a failed request."""
+        decode_record = decoder_for(record_class(data_class))
+        next_token = None
+        for _ in range(max_pages):
+            page_params = dict(params, next_token=next_token) if next_token else params
+            response = self._authorized_get(path, page_params, stream=True)
+            if response is None:
+                raise _PageFailed(path)
+            rest = {}
+            stored = []
+            timing = { "read": 0.0 }
+            parsing = decoding = 0.0
+            with response:
+                parse_started = time.perf_counter()
+                for item in json_stream.iter_array_items(self._read_body(path, response, timing), "data", rest):
+                    parsing += time.perf_counter() - parse_started
+                    if self.history is not None:
+                        stored.append(item)
+                        if len(stored) >= HISTORY_BATCH_SIZE:
+                            self.history.save(path, stored)
+                            stored = []
+                    decode_started = time.perf_counter()
+                    record = decode_record(item)
+                    decoding += time.perf_counter() - decode_started
+                    yield record
+                    parse_started = time.perf_counter()
+                parsing += time.perf_counter() - parse_started
+            # Parsing is interleaved with reading the body; the time spent waiting for it is not decoding.
+            telemetry.decode_duration.labels(path, "json").observe(max(parsing - timing["read"], 0.0))
+            telemetry.decode_duration.labels(path, "dataclass").observe(decoding)
+            if stored:
+                self.history.save(path, stored)
+            next_token = rest.get("next_token")
+            if not next_token:
+                return
+        logging.warning(f"{path} has more than {max_pages} pages; remaining pages were not fetched.")
+
+    def _read_body(self, path:str, response:requests.Response, timing:dict) -> Iterator[bytes]:
+        """Yield a streamed body in chunks, adding the time spent waiting for them to `timing["read"]`.
+
+        Once the body is read, its bytes are counted and the request is timed up to the last byte.
+        """
+        received = 0
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            timing["read"] += time.perf_counter() - started
+            if chunk is None:
+                break
+            received += len(chunk)
+            yield chunk
+        telemetry.response_bytes.labels(path).inc(received)
+        telemetry.request_duration.labels(path, str(response.status_code)).observe(response.elapsed.total_seconds() + timing["read"])
+
+    def _fetch_page(self, path:str, data_class:type, params:dict, page_number:int, track_changes:bool) -> tuple[Any, bool] | None:
+        """Fetch and decode one page, returning (page, unchanged) or None on failure.
+
+        With `track_changes` the previous page is revalidated with its ETag when the request is
+        otherwise identical, and a body with the same digest as before reuses the previous page
+        without parsing it. A page is only reported unchanged against one fetched with the same
+        params.
+        """
+        key = (path, page_number)
+        params_key = tuple(sorted(params.items()))
+        cached = self._pages.get(key) if track_changes else None
+        if cached != None and cached.params != params_key:
+            cached = None
+        headers = None
+        if cached != None and cached.etag:
+            headers = { "If-None-Match": cached.etag }
+        try:
+            response = self._authorized_get(path, params, headers)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"HTTP Request failed: {e}")
+            return None
+        if response is None:
+            return None
+        if response.status_code == 304:
+            if cached == None:
+                logging.error(f"{response.url} returned 304 without a cached page.")
+                return None
+            return cached.page, True
+
+        digest = hashlib.blake2b(response.content, digest_size=16).digest() if track_changes else None
+        if cached != None and cached.digest == digest:
+            page, unchanged = cached.page, True
+        else:
+            res_dict = self._parse_json(path, response)
+            page, unchanged = self._decode(path, data_class, res_dict), False
+            if self.history is not None and "data" in res_dict:
+                self.history.save(path, res_dict["data"])
+        if track_changes:
+            self._pages[key] = CachedPage(params_key, response.headers.get("ETag"), digest, page)
+        return page, unchanged
+
+    def _prefetch_pages(self, path:str, data_class:type, params:dict, max_pages:int, prefetch:int) -> Iterator[tuple[Any, bool] | None]:
+        pages = queue.Queue(maxsize=prefetch)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for page in self._iter_collection_pages(path, data_class, params, max_pages, 0, False):
+                    if not put(page):
+                        return
+            except Exception as e:
+                logging.error(f"Fetching {path} pages failed: {e}")
+                put(None)
+            put(done)
+
+        threading.Thread(target=produce, name=f"oura-pages-{path}", daemon=True).start()
+        try:
+            while (page := pages.get()) is not done:
+                yield page
+                if page is None:
+                    return
+        finally:
+            stopped.set()
+
+    def _parse_json(self, path:str, response:requests.Response) -> dict:
+        started = time.perf_counter()
+        res_dict = response.json()
+        telemetry.decode_duration.labels(path, "json").observe(time.perf_counter() - started)
+        return res_dict
+
+    def _decode(self, path:str, data_class:type, res_dict:dict):
+        started = time.perf_counter()
+        result = decode(data_class, res_dict)
+        telemetry.decode_duration.labels(path, "dataclass").observe(time.perf_counter() - started)
+        return result
+
+    def _authorized_get(self, path: str, params: dict, headers: dict | None = None, stream: bool = False, document_id: str | None = None) -> requests.Response | None:
         token = self.token_provider.get_access_token()
-        response = requests.get(
-            url=f"{self.url}/usercollection/{path}",
-            headers={
-                "Authorization": f"Bearer {token}",
-            },
-            params=params,
-            timeout=15,
-        )
+        response = self._get(path, params, token, headers, stream, document_id)
 
         if response.status_code == 401 and hasattr(self.token_provider, "refresh_access_token"):
             logging.warning("Access token rejected; attempting refresh.")
-            if self.token_provider.refresh_access_token():
+            if self.token_provider.refresh_access_token(rejected_token=token):
+                response.close()
                 token = self.token_provider.get_access_token()
-                response = requests.get(
-                    url=f"{self.url}/usercollection/{path}",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                    },
-                    params=params,
-                    timeout=15,
-                )
-
-        if response.status_code != 200:
+                response = self._get(path, params, token, headers, stream, document_id)
+
+        if response.status_code == 429:
+            response.close()
+            raise OuraRateLimitError(path, OuraRateLimitError.parse_retry_after(response.headers.get("Retry-After")))
+
+        if response.status_code not in (200, 304):
             logging.error(f"{response.url} return {response.status_code}: {response.text}")
+            response.close()
             return None
 
-        return response
\ No newline at end of file
+        return response
+
+    def _get(self, path: str, params: dict, token: str, headers: dict | None = None, stream: bool = False, document_id: str | None = None) -> requests.Response:
+        """Send one request; successful streamed responses are timed and counted by `_read_body` instead.
+
+        Telemetry is labelled by `path` only, so single documents do not add series per id.
+        """
+        started = time.perf_counter()
+        url = f"{self.url}/usercollection/{path}" if document_id is None else f"{self.url}/usercollection/{path}/{document_id}"
+        try:
+            response = self.http.get(
+                url=url,
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    **(headers or {}),
+                },
+                params=params,
+                stream=stream,
+            )
+        except requests.exceptions.RequestException:
+            telemetry.request_duration.labels(path, "error").observe(time.perf_counter() - started)
+            raise
+        if stream and response.status_code == 200:
+            return response
+        telemetry.request_duration.labels(path, str(response.status_code)).observe(time.perf_counter() - started)
+        if not stream:
+            telemetry.response_bytes.labels(path).inc(len(response.content))
+        return response
@@ -1,7 +1,10 @@
 import datetime
-from dataclasses import dataclass
+import functools
+import types
+import typing
+from dataclasses import dataclass, fields, is_dataclass
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyActivityContributors:
     meet_daily_targets: int
     move_every_hour: int
@@ -10,13 +13,13 @@ class OuraDailyActivityContributors:
     training_frequency: int
     training_volume: int
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyActivityMet:
     interval: float
     items: list[float]
     timestamp: datetime.datetime
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyActivity:
     id: str
     class_5_min: str
@@ -45,12 +48,12 @@ class OuraDailyActivity:
     day: datetime.date
     timestamp: datetime.datetime
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyActivities:
     data: list[OuraDailyActivity]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyReadinessContributors:
     activity_balance: int
     body_temperature: int
@@ -61,7 +64,7 @@ class OuraDailyReadinessContributors:
     resting_heart_rate: int
     sleep_balance: int
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyReadiness:
     id: str
     contributors: OuraDailyReadinessContributors
@@ -71,30 +74,30 @@ class OuraDailyReadiness:
     temperature_trend_deviation: float
     timestamp: datetime.datetime
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyReadinesses:
     data: list[OuraDailyReadiness]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyResilienceContributors:
     sleep_recovery: float
     daytime_recovery: float
     stress: float
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyResilience:
     id: str
     contributors: OuraDailyResilienceContributors
     day: datetime.date
     level: str
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyResiliences:
     data: list[OuraDailyResilience]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailySleepContributors:
     deep_sleep: int
     efficiency: int
@@ -104,7 +107,7 @@ class OuraDailySleepContributors:
     timing: int
     total_sleep: int
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailySleep:
     id: str
     contributors: OuraDailySleepContributors
@@ -112,28 +115,28 @@ class OuraDailySleep:
     score: int
     timestamp: datetime.datetime
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailySleeps:
     data: list[OuraDailySleep]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailySpo2Spo2Percentage:
     average: float
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailySpo2:
     id: str
     day: datetime.date
     breathing_disturbance_index: int | None
     spo2_percentage: OuraDailySpo2Spo2Percentage | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailySpo2s:
     data: list[OuraDailySpo2]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyStress:
     id: str
     day: datetime.date
@@ -141,23 +144,23 @@ class OuraDailyStress:
     recovery_high: int | None
     day_summary: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraDailyStresses:
     data: list[OuraDailyStress]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraHeartRate:
     bpm: int
     source: str
     timestamp: datetime.datetime
 
-@dataclass
+@dataclass(slots=True)
 class OuraHeartRates:
     data: list[OuraHeartRate]
     next_token: str | None
 
-@dataclass
+@dataclass(slots=True)
 class OuraPersonalInfo:
     id: str
     age: int
@@ -165,3 +168,88 @@ class OuraPersonalInfo:
     height: float
     biological_sex: str
     email: str
+
+
+_projections: dict[type, frozenset[str]] = {}
+
+def decode(data_class:type, data:dict):
+    """Build `data_class` from a decoded JSON dict using its compiled decoder."""
+    return decoder_for(data_class)(data)
+
+def set_projection(data_class:type, paths:typing.Iterable[str] | None) -> None:
+    """Decode only the dotted field `paths` of `data_class`, wherever it is decoded.
+
+    A path names a field (`score`) or a field of a nested dataclass (`contributors.stress`);
+    fields on no path are left as None without reading or converting their JSON values.
+    `None` restores full decoding.
+    """
+    if paths is None:
+        _projections.pop(data_class, None)
+    else:
+        _projections[data_class] = frozenset(paths)
+    decoder_for.cache_clear()
+
+@functools.cache
+def record_class(data_class:type) -> type:
+    """The record dataclass of a collection response, i.e. the element type of its `data` list."""
+    return typing.get_args(typing.get_type_hints(data_class)["data"])[0]
+
+@functools.cache
+def decoder_for(data_class:type, projection:frozenset[str] | None = None) -> typing.Callable[[dict], typing.Any]:
+    """Generate a specialized decode function for a response dataclass.
+
+    Type hints are resolved once here instead of on every record, and each field is
+    converted with a direct call (`fromisoformat`, nested decoder, list comprehension).
+    Required keys must be present; `X | None` fields default to None when missing.
+    Without an explicit `projection`, the one set with `set_projection` applies.
+    """
+    if projection is None:
+        projection = _projections.get(data_class)
+    hints = typing.get_type_hints(data_class)
+    namespace = {"data_class": data_class}
+    lines = ["def decode(d):"]
+    kwargs = []
+    for i, f in enumerate(fields(data_class)):
+        nested = None
+        if projection is not None and f.name not in projection:
+            nested = frozenset( p.removeprefix(f"{f.name}.") for p in projection if p.startswith(f"{f.name}.") )
+            if not nested:
+                kwargs.append(f"{f.name}=None")
+                continue
+        field_type, optional = _unwrap_optional(hints[f.name])
+        converter = _converter(field_type, namespace, i, nested)
+        if optional:
+            lines.append(f"    v{i} = d.get({f.name!r})")
+            if converter:
+                lines.append(f"    if v{i} is not None: v{i} = {converter.format(f'v{i}')}")
+        else:
+            value = f"d[{f.name!r}]"
+            lines.append(f"    v{i} = {converter.format(value) if converter else value}")
+        kwargs.append(f"{f.name}=v{i}")
+    lines.append(f"    return data_class({', '.join(kwargs)})")
+    exec("\n".join(lines), namespace)
+    return namespace["decode"]
+
+def _unwrap_optional(field_type) -> tuple[typing.Any, bool]:
+    if isinstance(field_type, types.UnionType) or typing.get_origin(field_type) is typing.Union:
+        args = [ a for a in typing.get_args(field_type) if a is not type(None) ]
+        if len(args) == 1:
+            return args[0], True
+    return field_type, False
+
+def _converter(field_type, namespace:dict, index:int, projection:frozenset[str] | None = None) -> str | None:
+    """Return a format string converting `{}` to `field_type`, or None when no conversion is needed."""
+    if field_type is datetime.datetime:
+        namespace["datetime"] = datetime.datetime
+        return "datetime.fromisoformat({})"
+    if field_type is datetime.date:
+        namespace["date"] = datetime.date
+        return "date.fromisoformat({})"
+    if is_dataclass(field_type):
+        namespace[f"decode_{index}"] = decoder_for(field_type, projection)
+        return f"decode_{index}({{}})"
+    if typing.get_origin(field_type) is list:
+        item_converter = _converter(typing.get_args(field_type)[0], namespace, index, projection)
+        if item_converter:
+            return f"[{item_converter.format('i')} for i in {{}}]"
+    return None
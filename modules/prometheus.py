@@ -1,8 +1,14 @@
-from prometheus_client import Gauge, Counter, Info, CollectorRegistry
+from prometheus_client import Gauge, Counter, Histogram, Info, CollectorRegistry
+from prometheus_client.core import GaugeHistogramMetricFamily, SummaryMetricFamily
+from prometheus_client.utils import floatToGoString
+from bisect import bisect_right
 from dataclasses import dataclass
 from dacite import from_dict
+import math
 import yaml
 
+DEFAULT_QUANTILES = [0.5, 0.9, 0.99]
+
 @dataclass
 class OuraMetricsConfig:
     name: str
@@ -11,6 +17,8 @@ class OuraMetricsConfig:
     unit: str | None
     labels: list[str]
     iterator: str | None
+    buckets: list[float] | None = None
+    quantiles: list[float] | None = None
 
 @dataclass
 class OuraCategoryConfig:
@@ -18,6 +26,7 @@ class OuraCategoryConfig:
     prefix: str
     labels: list[str]
     metrics: list[OuraMetricsConfig]
+    interval: int | None = None
 
 @dataclass
 class OuraRootConfig:
@@ -33,8 +42,10 @@ def create_metric_instance(definition:OuraMetricsConfig, registry:CollectorRegis
         m = Gauge( prefix + definition.name, definition.desc, definition.labels, registry=registry )
     elif definition.type == 'counter':
         m = Counter( prefix + definition.name, definition.desc, definition.labels, registry=registry )
+    elif definition.type == 'histogram':
+        m = SeriesHistogram( prefix + definition.name, definition.desc, definition.labels, definition.buckets, registry=registry )
     elif definition.type == 'summary':
-        m = Counter( prefix + definition.name, definition.desc, definition.labels, registry=registry )
+        m = SeriesSummary( prefix + definition.name, definition.desc, definition.labels, definition.quantiles, registry=registry )
     elif definition.type == 'info':
         m = Info( prefix + definition.name, definition.desc, definition.labels, registry=registry )
     else:
@@ -50,5 +61,131 @@ def set_metrics(m, labels:list, value):
         m.labels(*labels).info({'val': value})
     elif m._type == 'counter':
         m.labels(*labels).inc(value)
+    elif m._type in ('histogram', 'summary'):
+        m.labels(*labels).observe_all(value)
     else:
         pass
+
+def bind_setter(m, labels:tuple):
+    """Return a callable that sets the labelled child of `m`, skipping None.
+
+    The child is resolved on the first value that is not None and reused afterwards, so a
+    metric that never has a value is not exported as 0.
+    """
+    if m._type == 'gauge':
+        bind = lambda child: child.set
+    elif m._type == 'info':
+        bind = lambda child: lambda value: child.info({'val': value})
+    elif m._type == 'counter':
+        bind = lambda child: child.inc
+    elif m._type in ('histogram', 'summary'):
+        bind = lambda child: child.observe_all
+    else:
+        return lambda value: None
+
+    update = None
+    def setter(value):
+        nonlocal update
+        if value != None:
+            if update == None:
+                update = bind(m.labels(*labels))
+            update(value)
+    return setter
+
+def metric_samples(definition:OuraMetricsConfig, prefix:str, labels:dict, value) -> list[tuple[str, dict, float]]:
+    """Render one metric value as (name, labels, value) samples, named like the registry would expose them.
+
+    Only scalar types are supported; histogram and summary metrics yield no samples.
+    """
+    if value == None:
+        return []
+    name = prefix + definition.name
+    if definition.type == 'gauge':
+        return [(name, labels, float(value))]
+    elif definition.type == 'counter':
+        return [(name + '_total', labels, float(value))]
+    elif definition.type == 'info':
+        return [(name + '_info', dict(labels, val=str(value)), 1.0)]
+    return []
+
+class _SeriesChild:
+    def __init__(self, parent, labelvalues:tuple):
+        self._parent = parent
+        self._labelvalues = labelvalues
+
+    def observe_all(self, values):
+        """Replace this series' distribution with the one of `values`, bucketed in one pass over the sorted values."""
+        self._parent._samples[self._labelvalues] = self._parent._summarize(sorted(values))
+
+class _SeriesMetric:
+    """Distribution of the sequence a metric iterator resolves to, such as `met.items`.
+
+    Each update replaces the previous distribution for that label set, so the exported values
+    describe the latest record instead of accumulating the same samples on every cycle.
+    """
+    _type = ''
+
+    def __init__(self, name:str, documentation:str, labelnames:list[str], registry:CollectorRegistry | None = None):
+        self._name = name
+        self._documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._samples = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *labelvalues):
+        return _SeriesChild(self, tuple(str(v) for v in labelvalues))
+
+    def remove(self, *labelvalues):
+        self._samples.pop(tuple(str(v) for v in labelvalues), None)
+
+    def describe(self):
+        return [self._family()]
+
+    def collect(self):
+        family = self._family()
+        for labelvalues, snapshot in list(self._samples.items()):
+            self._add(family, list(labelvalues), snapshot)
+        return [family]
+
+class SeriesHistogram(_SeriesMetric):
+    """Exported as an OpenMetrics gauge histogram: bucket counts may go down between updates."""
+    _type = 'histogram'
+
+    def __init__(self, name:str, documentation:str, labelnames:list[str], buckets:list[float] | None = None, registry:CollectorRegistry | None = None):
+        self._buckets = sorted(float(b) for b in (buckets or Histogram.DEFAULT_BUCKETS) if not math.isinf(b))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _summarize(self, values:list) -> tuple:
+        counts = [ bisect_right(values, bound) for bound in self._buckets ]
+        return counts, len(values), sum(values)
+
+    def _family(self):
+        return GaugeHistogramMetricFamily(self._name, self._documentation, labels=self._labelnames)
+
+    def _add(self, family, labelvalues:list, snapshot:tuple):
+        counts, count, total = snapshot
+        buckets = [ (floatToGoString(bound), c) for bound, c in zip(self._buckets, counts) ]
+        buckets.append(('+Inf', count))
+        family.add_metric(labelvalues, buckets, gsum_value=total)
+
+class SeriesSummary(_SeriesMetric):
+    _type = 'summary'
+
+    def __init__(self, name:str, documentation:str, labelnames:list[str], quantiles:list[float] | None = None, registry:CollectorRegistry | None = None):
+        self._quantiles = sorted(quantiles or DEFAULT_QUANTILES)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _summarize(self, values:list) -> tuple:
+        # Nearest-rank quantiles over the sorted values.
+        quantiles = [ values[max(math.ceil(q * len(values)), 1) - 1] for q in self._quantiles ] if values else []
+        return quantiles, len(values), sum(values)
+
+    def _family(self):
+        return SummaryMetricFamily(self._name, self._documentation, labels=self._labelnames)
+
+    def _add(self, family, labelvalues:list, snapshot:tuple):
+        quantiles, count, total = snapshot
+        family.add_metric(labelvalues, count_value=count, sum_value=total)
+        for q, value in zip(self._quantiles, quantiles):
+            family.add_sample(self._name, dict(zip(self._labelnames, labelvalues), quantile=floatToGoString(q)), value)
@@ -0,0 +1,120 @@
+import concurrent.futures
+import datetime
+import logging
+import threading
+import time
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.registry import Collector
+
+import modules.collector as collector
+from modules import telemetry
+from modules.oura import OuraRateLimitError
+from modules.snapshot import SnapshotStore
+from modules.users import OuraUser
+
+logger = logging.getLogger(__name__)
+
+
+class ScrapeCollector(Collector):
+    """Fetches Oura data when Prometheus scrapes instead of on a background loop.
+
+    A user's category is refreshed only when its values are older than its minimum refresh age.
+    Concurrent scrapes share one in-flight upstream fetch per user and category, and a scrape that
+    hits `deadline` is answered with the last good values while the fetch finishes.
+    """
+
+    def __init__(
+        self,
+        users: list[OuraUser],
+        plans: dict[str, collector.CategoryPlan],
+        registry: CollectorRegistry,
+        executor: concurrent.futures.Executor,
+        min_age: dict[str, float],
+        deadline: float,
+        tz: datetime.tzinfo | None = None,
+        snapshot: SnapshotStore | None = None,
+    ):
+        self.users = users
+        self.executor = executor
+        self.min_age = min_age
+        self.deadline = deadline
+        self.tz = tz
+        self.registry = registry
+        self.plans = plans
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._in_flight: dict[tuple[str, str], concurrent.futures.Future] = {}
+        self._next_refresh: dict[tuple[str, str], float] = {}
+
+    def describe(self):
+        # Keep registration from triggering an upstream fetch.
+        return []
+
+    def collect(self):
+        futures = [ f for f in (self._refresh_if_stale(u, c) for u in self.users for c in self.plans.values()) if f is not None ]
+        if futures:
+            _, pending = concurrent.futures.wait(futures, timeout=self.deadline)
+            if pending:
+                logging.warning(f"{len(pending)} categories did not refresh within {self.deadline}s; serving last good values.")
+        with self._apply_lock:
+            families = list(self.registry.collect())
+        if self.snapshot is not None:
+            self.snapshot.save(self.users)
+        return families
+
+    def invalidate(self, user: OuraUser, category_name: str) -> None:
+        """Refresh a user's category on the next scrape regardless of its age."""
+        with self._lock:
+            self._next_refresh.pop((user.name, category_name), None)
+
+    def _refresh_if_stale(self, user: OuraUser, plan: collector.CategoryPlan) -> concurrent.futures.Future | None:
+        key = (user.name, plan.category.name)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            if time.monotonic() < self._next_refresh.get(key, 0.0):
+                return None
+            future = self.executor.submit(self._refresh, user, plan)
+            self._in_flight[key] = future
+            return future
+
+    def _refresh(self, user: OuraUser, plan: collector.CategoryPlan) -> None:
+        category = plan.category
+        key = (user.name, category.name)
+        started = time.monotonic()
+        next_refresh = started + self.min_age.get(category.name, 0.0)
+        try:
+            now = datetime.datetime.now(self.tz)
+            metrics = plan.fetch(user.oura, now, user.watermarks)
+            if metrics is not None and metrics is user.applied.get(category.name):
+                logging.debug(f"{category.name} for {user.name} is unchanged; skipping update.")
+                telemetry.payloads.labels(category.name, "unchanged").inc()
+                telemetry.last_success.labels(user.name, category.name).set_to_current_time()
+                with self._apply_lock:
+                    collector.expire_days(plan, user.labels, now.date())
+                return
+            values = {} if self.snapshot is not None else None
+            with self._apply_lock:
+                if collector.apply_category(plan, metrics, user.labels, user.heartrate, tz=self.tz, values=values):
+                    user.applied[category.name] = metrics
+                    if values is not None:
+                        self.snapshot.record(user, category.name, values)
+                    user.watermarks.update(category.name, metrics)
+                    telemetry.payloads.labels(category.name, "changed").inc()
+                    telemetry.cycle_duration.labels(category.name).observe(time.monotonic() - started)
+                    telemetry.last_success.labels(user.name, category.name).set_to_current_time()
+                    newest = collector.newest_record_timestamp(metrics, self.tz)
+                    if newest is not None:
+                        telemetry.latest_record.labels(user.name, category.name).set(newest)
+        except OuraRateLimitError as e:
+            logging.warning(f"getting {category.name} for {user.name} was rate limited: {e}")
+            next_refresh = time.monotonic() + max(e.retry_after, self.min_age.get(category.name, 0.0))
+        except Exception as e:
+            logging.error(f"getting {category.name} for {user.name} raised an error: {e}")
+        finally:
+            with self._lock:
+                self._next_refresh[key] = next_refresh
+                del self._in_flight[key]
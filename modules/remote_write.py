@@ -0,0 +1,201 @@
+import logging
+import math
+import queue
+import struct
+import threading
+import time
+
+import requests
+
+from modules import snappy
+from modules.http_client import HttpClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_SUBMIT_TIMEOUT = 10.0
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 30.0
+# Series not submitted for this long, e.g. days that left the EXPORT_DAYS window, are forgotten.
+DEFAULT_SERIES_TTL = 2 * 24 * 3600.0
+
+# (metric name, labels, value, timestamp in milliseconds)
+Sample = tuple[str, dict, float, int]
+
+
+def encode_write_request(samples: list[Sample]) -> bytes:
+    """Encode samples as a prometheus.WriteRequest protobuf, one TimeSeries per label set."""
+    series: dict[tuple, list[tuple[float, int]]] = {}
+    for name, labels, value, timestamp in samples:
+        key = tuple(sorted({**labels, "__name__": name}.items()))
+        series.setdefault(key, []).append((value, timestamp))
+
+    out = bytearray()
+    for key, points in series.items():
+        body = bytearray()
+        for label_name, label_value in key:
+            label = _bytes_field(1, label_name.encode()) + _bytes_field(2, str(label_value).encode())
+            body += _bytes_field(1, label)
+        for value, timestamp in sorted(points, key=lambda p: p[1]):
+            sample = b"\x09" + struct.pack("<d", value) + b"\x10" + _varint(timestamp & 0xFFFFFFFFFFFFFFFF)
+            body += _bytes_field(2, sample)
+        out += _bytes_field(1, body)
+    return bytes(out)
+
+
+class RemoteWriter:
+    """Pushes samples to a Prometheus remote_write endpoint from a background thread.
+
+    `submit` enqueues samples into a bounded queue and blocks for up to `submit_timeout` when
+    it is full, so a slow receiver applies backpressure to collection instead of growing
+    memory. The sender batches up to `batch_size` samples or `flush_interval` seconds and retries
+    5xx/429 and connection errors with exponential backoff. A batch rejected with 400 is split
+    and resent in halves, so only the samples the receiver refuses are dropped; other 4xx
+    drop the batch.
+
+    Receivers only accept samples newer than the last one of a series. Samples identical to
+    the last one sent are skipped, and a revised value at a timestamp that was already sent,
+    e.g. a daily score changing during its day, is sent at the current time instead.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        http_client: HttpClient,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        submit_timeout: float = DEFAULT_SUBMIT_TIMEOUT,
+        series_ttl: float = DEFAULT_SERIES_TTL,
+        headers: dict | None = None,
+        auth: tuple[str, str] | None = None,
+    ):
+        self.url = url
+        self.http = http_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.submit_timeout = submit_timeout
+        self.series_ttl = series_ttl
+        self.headers = {
+            "Content-Encoding": "snappy",
+            "Content-Type": "application/x-protobuf",
+            "X-Prometheus-Remote-Write-Version": "0.1.0",
+            **(headers or {}),
+        }
+        self.auth = auth
+        self.sent = 0
+        self.dropped = 0
+        self._queue: queue.Queue[Sample] = queue.Queue(maxsize=queue_size)
+        # Per series: timestamp and value of the last queued sample, and when it was last submitted.
+        self._last_sent: dict[tuple, tuple[int, float, float]] = {}
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="remote-write", daemon=True)
+        self._thread.start()
+
+    def submit(self, samples: list[Sample]) -> int:
+        """Queue samples for sending; returns how many were dropped because the queue stayed full."""
+        now = time.monotonic()
+        deadline = now + self.submit_timeout
+        dropped = 0
+        self._prune(now)
+        for sample in samples:
+            name, labels, value, timestamp = sample
+            key = (name, tuple(sorted(labels.items())))
+            with self._lock:
+                last = self._last_sent.get(key)
+                if last is not None and timestamp <= last[0]:
+                    if value == last[1] or (math.isnan(value) and math.isnan(last[1])):
+                        self._last_sent[key] = (last[0], last[1], now)
+                        continue
+                    timestamp = max(int(time.time() * 1000), last[0] + 1)
+                    sample = (name, labels, value, timestamp)
+                self._last_sent[key] = (timestamp, value, now)
+            try:
+                self._queue.put(sample, timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Full:
+                with self._lock:
+                    if last is None:
+                        self._last_sent.pop(key, None)
+                    else:
+                        self._last_sent[key] = last
+                dropped += 1
+        if dropped:
+            self.dropped += dropped
+            logging.warning(f"remote_write queue is full; dropped {dropped} samples.")
+        return dropped
+
+    def _prune(self, now: float) -> None:
+        with self._lock:
+            if now - self._pruned_at < self.series_ttl / 4:
+                return
+            self._pruned_at = now
+            self._last_sent = { key: last for key, last in self._last_sent.items() if now - last[2] < self.series_ttl }
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            flush_at = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(flush_at - time.monotonic(), 0.0)))
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch: list[Sample]) -> None:
+        rejected = self._post(batch)
+        if rejected:
+            logging.error(f"remote_write rejected {rejected} of {len(batch)} samples.")
+
+    def _post(self, batch: list[Sample]) -> int:
+        """Send one batch; returns how many of its samples the receiver rejected with 400."""
+        payload = snappy.compress(encode_write_request(batch))
+        backoff = RETRY_BACKOFF
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.http.post(self.url, data=payload, headers=self.headers, auth=self.auth)
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"remote_write request failed: {e}")
+            else:
+                if response.status_code < 300:
+                    self.sent += len(batch)
+                    return 0
+                if response.status_code == 400 and len(batch) > 1:
+                    # Usually only some samples are refused, e.g. as out of order; resending the
+                    # accepted ones is harmless, as receivers ignore exact duplicates.
+                    middle = len(batch) // 2
+                    return self._post(batch[:middle]) + self._post(batch[middle:])
+                if response.status_code == 400:
+                    logging.debug(f"remote_write rejected {batch[0][0]} at {batch[0][3]}: {response.text}")
+                    self.dropped += 1
+                    return 1
+                if response.status_code < 500 and response.status_code != 429:
+                    logging.error(f"remote_write rejected {len(batch)} samples with {response.status_code}: {response.text}")
+                    self.dropped += len(batch)
+                    return 0
+                logging.warning(f"remote_write returned {response.status_code}; retrying.")
+            if attempt < self.max_retries:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+        logging.error(f"remote_write gave up on {len(batch)} samples after {self.max_retries} retries.")
+        self.dropped += len(batch)
+        return 0
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _bytes_field(number: int, value: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
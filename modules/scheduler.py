@@ -0,0 +1,84 @@
+import heapq
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60.0
+DEFAULT_JITTER = 0.1
+MAX_BACKOFF = 3600.0
+
+
+class CategoryScheduler:
+    """Priority queue of next-due times, one entry per metric category.
+
+    Each category is polled on its own interval with a random jitter so requests do not
+    line up. When the API rate limits a category it is pushed back by `Retry-After`, doubling
+    on consecutive 429s up to `max_backoff`, and never polled sooner than its interval.
+    """
+
+    def __init__(
+        self,
+        intervals: dict[str, float],
+        jitter: float = DEFAULT_JITTER,
+        max_backoff: float = MAX_BACKOFF,
+        clock=time.monotonic,
+    ):
+        self.intervals = dict(intervals)
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._throttled: dict[str, int] = {}
+        self._due_at: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+        now = self.clock()
+        for name in self.intervals:
+            self._push(name, now)
+
+    def pop_due(self) -> list[str]:
+        """Remove and return every category whose due time has passed."""
+        now = self.clock()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, name = heapq.heappop(self._heap)
+                if self._due_at.get(name) != due_at:
+                    continue  # superseded by a later reschedule or trigger
+                del self._due_at[name]
+                due.append(name)
+        return due
+
+    def reschedule(self, name: str, retry_after: float | None = None) -> None:
+        interval = self.intervals.get(name, DEFAULT_INTERVAL)
+        if retry_after is not None:
+            throttled = self._throttled.get(name, 0) + 1
+            self._throttled[name] = throttled
+            delay = max(interval, min(retry_after * 2 ** (throttled - 1), self.max_backoff))
+            logger.warning(f"{name} was rate limited; next request in {delay:.0f}s.")
+        else:
+            self._throttled.pop(name, None)
+            delay = interval * (1 + random.uniform(-self.jitter, self.jitter))
+        with self._lock:
+            due_at = self.clock() + delay
+            if retry_after is None and self._due_at.get(name, due_at) < due_at:
+                return  # triggered while in flight; keep the earlier time
+            self._push(name, due_at)
+
+    def trigger(self, name: str) -> None:
+        """Make a category due immediately unless it is currently backing off a rate limit."""
+        if name not in self.intervals or self._throttled.get(name):
+            return
+        with self._lock:
+            self._push(name, self.clock())
+
+    def next_due(self) -> float | None:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _push(self, name: str, due_at: float) -> None:
+        self._due_at[name] = due_at
+        heapq.heappush(self._heap, (due_at, name))
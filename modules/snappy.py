@@ -0,0 +1,127 @@
+"""Pure-Python Snappy block format, as required by the Prometheus remote_write protocol.
+
+Payloads here are a few kilobytes of protobuf per batch, so a greedy hash-chain matcher is
+fast enough and avoids a compiled dependency.
+"""
+
+MAX_BLOCK_SIZE = 65536
+MIN_MATCH = 4
+MAX_OFFSET = 65535
+
+
+class SnappyError(ValueError):
+    pass
+
+
+def compress(data: bytes) -> bytes:
+    out = bytearray(_varint(len(data)))
+    for block_start in range(0, len(data), MAX_BLOCK_SIZE):
+        _compress_block(data[block_start:block_start + MAX_BLOCK_SIZE], out)
+    return bytes(out)
+
+
+def decompress(data: bytes) -> bytes:
+    length, pos = _read_varint(data, 0)
+    out = bytearray()
+    while pos < len(data):
+        tag = data[pos]
+        kind = tag & 0x03
+        pos += 1
+        if kind == 0:
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            size += 1
+            out += data[pos:pos + size]
+            pos += size
+            continue
+        if kind == 1:
+            size = ((tag >> 2) & 0x07) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 2], "little")
+            pos += 2
+        else:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 4], "little")
+            pos += 4
+        if offset == 0 or offset > len(out):
+            raise SnappyError("invalid copy offset")
+        for _ in range(size):  # copies may overlap their own output
+            out.append(out[-offset])
+    if len(out) != length:
+        raise SnappyError(f"expected {length} bytes, got {len(out)}")
+    return bytes(out)
+
+
+def _compress_block(block: bytes, out: bytearray) -> None:
+    table: dict[bytes, int] = {}
+    literal_start = 0
+    pos = 0
+    end = len(block) - MIN_MATCH
+    while pos <= end:
+        key = block[pos:pos + MIN_MATCH]
+        candidate = table.get(key)
+        table[key] = pos
+        if candidate is None or pos - candidate > MAX_OFFSET:
+            pos += 1
+            continue
+        size = MIN_MATCH
+        while pos + size < len(block) and block[candidate + size] == block[pos + size]:
+            size += 1
+        _emit_literal(block[literal_start:pos], out)
+        _emit_copy(pos - candidate, size, out)
+        pos += size
+        literal_start = pos
+    _emit_literal(block[literal_start:], out)
+
+
+def _emit_literal(literal: bytes, out: bytearray) -> None:
+    if not literal:
+        return
+    n = len(literal) - 1
+    if n < 60:
+        out.append(n << 2)
+    else:
+        extra = (n.bit_length() + 7) // 8
+        out.append((59 + extra) << 2)
+        out += n.to_bytes(extra, "little")
+    out += literal
+
+
+def _emit_copy(offset: int, size: int, out: bytearray) -> None:
+    while size > 0:
+        if 4 <= size <= 11 and offset < 2048:
+            out.append(0x01 | ((size - 4) << 2) | ((offset >> 8) << 5))
+            out.append(offset & 0xFF)
+            return
+        chunk = min(size, 64)
+        out.append(0x02 | ((chunk - 1) << 2))
+        out += offset.to_bytes(2, "little")
+        size -= chunk
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise SnappyError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
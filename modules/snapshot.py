@@ -0,0 +1,135 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import modules.collector as collector
+from modules.collector import CategoryPlan
+from modules.users import OuraUser
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+@dataclass
+class UserSnapshot:
+    labels: list[str]
+    values: dict[str, dict[str, Any]] = field(default_factory=dict)
+    watermarks: dict[str, str] = field(default_factory=dict)
+    heartrate: dict | None = None
+
+class SnapshotStore:
+    """Persists the last exported values per user so a restart can serve them before any fetch.
+
+    `record` keeps the values a category was last applied with; `save` writes them with each
+    user's labels and watermarks, and with `include_heartrate` also the heartrate samples behind
+    the window stats. On startup `restore` sets the saved values through the compiled plans and
+    `prepare` hands watermarks and heartrate samples to the users built afterwards.
+    """
+
+    def __init__(self, path: str | Path, include_heartrate: bool = False):
+        self.path = Path(path).expanduser()
+        self.include_heartrate = include_heartrate
+        self.snapshots: dict[str, UserSnapshot] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self) -> dict[str, UserSnapshot]:
+        if not self.path.exists():
+            return {}
+        try:
+            with self.path.open(encoding="utf-8") as fp:
+                raw = json.load(fp)
+            if raw.get("version") != SNAPSHOT_VERSION:
+                logging.warning(f"Ignoring snapshot {self.path} with version {raw.get('version')}.")
+                return {}
+            self.snapshots = { name: UserSnapshot(**user) for name, user in raw["users"].items() }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Could not read snapshot {self.path}: {e}")
+            return {}
+        return self.snapshots
+
+    def restore(self, plans: dict[str, CategoryPlan], tz: datetime.tzinfo | None = None) -> int:
+        """Set every saved value on the plans' metrics; returns the number of values restored.
+
+        Per-day values are kept or dropped by today's date in `tz`, like the collection loops do.
+        """
+        restored = 0
+        today = datetime.datetime.now(tz).date()
+        for snapshot in self.snapshots.values():
+            for category_name, values in snapshot.values.items():
+                plan = plans.get(category_name)
+                if plan != None:
+                    restored += collector.restore_values(plan, snapshot.labels, values, today)
+        return restored
+
+    def prepare(self, user: OuraUser) -> None:
+        """Seed a newly built user with its saved watermarks and heartrate samples."""
+        snapshot = self.snapshots.get(user.name)
+        if snapshot == None:
+            return
+        watermarks = snapshot.watermarks
+        if snapshot.heartrate == None:
+            # Without the samples, resuming from the heartrate watermark would leave the window
+            # stats covering only the overlap; fetch the whole window again instead.
+            watermarks = { name: mark for name, mark in watermarks.items() if name != 'heartrate' }
+        try:
+            user.watermarks.load(watermarks)
+            if snapshot.heartrate != None:
+                user.heartrate.load(snapshot.heartrate, datetime.datetime.now(datetime.timezone.utc))
+        except (ValueError, KeyError) as e:
+            logging.warning(f"Could not restore sync state for {user.name}: {e}")
+            return
+        if snapshot.labels != user.labels:
+            # Values restored under old labels would otherwise linger next to the new ones.
+            logging.info(f"Labels of {user.name} changed since the snapshot; stale series remain until restart.")
+
+    def record(self, user: OuraUser, category_name: str, values: dict[str, Any]) -> None:
+        with self._lock:
+            snapshot = self.snapshots.get(user.name)
+            if snapshot == None or snapshot.labels != user.labels:
+                snapshot = self.snapshots[user.name] = UserSnapshot(labels=list(user.labels))
+            snapshot.values[category_name] = { name: _jsonable(value) for name, value in values.items() }
+            self._dirty = True
+
+    def save(self, users: list[OuraUser]) -> None:
+        """Write the snapshot atomically if anything was recorded since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            for user in users:
+                snapshot = self.snapshots.get(user.name)
+                if snapshot == None:
+                    continue
+                snapshot.watermarks = user.watermarks.dump()
+                snapshot.heartrate = user.heartrate.dump() if self.include_heartrate and len(user.heartrate) else None
+            payload = { "version": SNAPSHOT_VERSION, "users": { name: vars(s) for name, s in self.snapshots.items() } }
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                        json.dump(payload, fp, separators=(",", ":"))
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    Path(tmp_path).unlink(missing_ok=True)
+                    raise
+            except OSError as e:
+                logging.warning(f"Could not write snapshot {self.path}: {e}")
+                self._dirty = True
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value == None:
+        return value
+    if isinstance(value, dict):
+        return { k: _jsonable(v) for k, v in value.items() }
+    if isinstance(value, Sequence):
+        return list(value)
+    return str(value)
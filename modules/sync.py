@@ -0,0 +1,85 @@
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_DAYS = 7
+DEFAULT_OVERLAP_DAYS = 1
+DEFAULT_HEARTRATE_WINDOW = datetime.timedelta(days=1)
+DEFAULT_HEARTRATE_OVERLAP = datetime.timedelta(minutes=15)
+
+
+class SyncWatermarks:
+    """Per-category high-water marks used to request only new data after the initial load.
+
+    Daily categories are tracked by the latest `day` seen, heartrate by the latest `timestamp`.
+    Each window reaches back by a small overlap so late revisions of the newest record are
+    picked up, and is never wider than the initial load window.
+    """
+
+    def __init__(
+        self,
+        initial_days: int = DEFAULT_INITIAL_DAYS,
+        overlap_days: int = DEFAULT_OVERLAP_DAYS,
+        heartrate_window: datetime.timedelta = DEFAULT_HEARTRATE_WINDOW,
+        heartrate_overlap: datetime.timedelta = DEFAULT_HEARTRATE_OVERLAP,
+    ):
+        self.initial_days = initial_days
+        self.overlap_days = overlap_days
+        self.heartrate_window = heartrate_window
+        self.heartrate_overlap = heartrate_overlap
+        self._marks: dict[str, datetime.date | datetime.datetime] = {}
+        self._lock = threading.Lock()
+
+    def get(self, category_name: str) -> datetime.date | datetime.datetime | None:
+        with self._lock:
+            return self._marks.get(category_name)
+
+    def daily_window(self, category_name: str, now: datetime.datetime) -> tuple[datetime.date, datetime.date]:
+        """Date range for a daily category; heartrate uses `heartrate_window_for`."""
+        if category_name == 'heartrate':
+            raise ValueError("heartrate has no daily window; use heartrate_window_for")
+        today = now.date()
+        start_date = (now - datetime.timedelta(days=self.initial_days)).date()
+        mark = self.get(category_name)
+        if mark is not None:
+            start_date = max(start_date, mark - datetime.timedelta(days=self.overlap_days))
+        return start_date, today
+
+    def heartrate_window_for(self, category_name: str, now: datetime.datetime) -> tuple[datetime.datetime, datetime.datetime]:
+        start_datetime = now - self.heartrate_window
+        mark = self.get(category_name)
+        if mark is not None:
+            start_datetime = max(start_datetime, mark - self.heartrate_overlap)
+        return start_datetime, now
+
+    def update(self, category_name: str, metrics) -> None:
+        data = getattr(metrics, "data", None)
+        if not data:
+            return
+        latest = data[-1]
+        mark = latest.timestamp if category_name == 'heartrate' else latest.day
+        with self._lock:
+            previous = self._marks.get(category_name)
+            if previous is None or mark > previous:
+                self._marks[category_name] = mark
+                logger.debug(f"{category_name} watermark advanced to {mark}")
+
+    def rewind(self, category_name: str, mark: datetime.date | datetime.datetime) -> None:
+        """Move a watermark back so the next window covers `mark`, e.g. after a change notification."""
+        with self._lock:
+            previous = self._marks.get(category_name)
+            if previous is not None and mark < previous:
+                self._marks[category_name] = mark
+                logger.debug(f"{category_name} watermark rewound to {mark}")
+
+    def dump(self) -> dict[str, str]:
+        with self._lock:
+            return { name: mark.isoformat() for name, mark in self._marks.items() }
+
+    def load(self, dumped: dict[str, str]) -> None:
+        """Restore marks from `dump`; heartrate marks are datetimes, the others dates."""
+        with self._lock:
+            for name, mark in dumped.items():
+                self._marks[name] = datetime.datetime.fromisoformat(mark) if name == 'heartrate' else datetime.date.fromisoformat(mark)
@@ -0,0 +1,94 @@
+"""The exporter's own metrics, kept apart from the Oura metrics defined in metrics.yml.
+
+The metrics are module-level so the API client, the token manager and the loops can record
+into them without passing a registry around; `register` exposes them on the served registry.
+"""
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+PREFIX = "oura_exporter_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+request_duration = Histogram(
+    PREFIX + "request_duration_seconds", "Oura API request latency, including reading the body",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS, registry=None,
+)
+response_bytes = Counter(
+    PREFIX + "response_bytes", "Oura API response body bytes after content decoding",
+    ["endpoint"], registry=None,
+)
+decode_duration = Histogram(
+    PREFIX + "decode_duration_seconds", "Time spent decoding Oura API responses; stage is json or dataclass",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS, registry=None,
+)
+update_duration = Histogram(
+    PREFIX + "update_duration_seconds", "Time spent setting a category's metrics from a response",
+    ["category"], buckets=LATENCY_BUCKETS, registry=None,
+)
+cycle_duration = Histogram(
+    PREFIX + "cycle_duration_seconds", "Time from starting a category's fetch to its metrics being updated",
+    ["category"], buckets=LATENCY_BUCKETS, registry=None,
+)
+token_requests = Counter(
+    PREFIX + "token_requests", "OAuth token endpoint requests; result is success or failure",
+    ["grant_type", "result"], registry=None,
+)
+token_request_duration = Histogram(
+    PREFIX + "token_request_duration_seconds", "OAuth token endpoint latency",
+    ["grant_type"], buckets=LATENCY_BUCKETS, registry=None,
+)
+payloads = Counter(
+    PREFIX + "payloads", "Fetched category payloads; result is changed, or unchanged when applying them was skipped",
+    ["category", "result"], registry=None,
+)
+last_success = Gauge(
+    PREFIX + "last_success_timestamp_seconds", "Unix time a category was last fetched and applied successfully",
+    ["user", "category"], registry=None,
+)
+latest_record = Gauge(
+    PREFIX + "latest_record_timestamp_seconds", "Start of the newest day, or time of the newest sample, a category's data covers",
+    ["user", "category"], registry=None,
+)
+history_records = Counter(
+    PREFIX + "history_records", "Records written to or read from the history store; operation is stored or served",
+    ["category", "operation"], registry=None,
+)
+render_duration = Histogram(
+    PREFIX + "render_duration_seconds", "Time spent rendering the /metrics exposition after a change; content_type is the format",
+    ["content_type"], buckets=LATENCY_BUCKETS, registry=None,
+)
+
+METRICS = (
+    request_duration, response_bytes, decode_duration, update_duration,
+    cycle_duration, token_requests, token_request_duration, payloads, last_success, latest_record, history_records, render_duration,
+)
+
+def register(registry:CollectorRegistry) -> None:
+    for m in METRICS:
+        registry.register(m)
+
+class HttpClientCollector(Collector):
+    """Reads the shared HTTP client's request counters and connection pools when scraped."""
+
+    def __init__(self, http_client):
+        self.http_client = http_client
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        stats = self.http_client.stats()
+        requests = CounterMetricFamily(PREFIX + "http_requests", "Requests sent by the shared HTTP client, including OAuth")
+        requests.add_metric([], stats["requests"])
+        errors = CounterMetricFamily(PREFIX + "http_request_errors", "Requests that failed without a response after all retries")
+        errors.add_metric([], stats["errors"])
+        connections = CounterMetricFamily(PREFIX + "http_connections", "Connections opened per host; stays flat while keep-alive works", labels=["host"])
+        in_use = GaugeMetricFamily(PREFIX + "http_pool_in_use", "Pooled connections currently checked out per host", labels=["host"])
+        for host, pool in stats["pools"].items():
+            connections.add_metric([host], pool["connections"])
+            in_use.add_metric([host], pool["maxsize"] - pool["idle"])
+        return [requests, errors, connections, in_use]
+
+def register_http_client(registry:CollectorRegistry, http_client) -> None:
+    registry.register(HttpClientCollector(http_client))
@@ -0,0 +1,57 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+from pathlib import Path
+
+from modules.heartrate_store import HeartRateSeries
+from modules.http_client import HttpClient
+from modules.oauth import TOKEN_URL, OAuthTokenManager
+from modules.oura import Oura
+from modules.scheduler import CategoryScheduler
+from modules.sync import SyncWatermarks
+
+logger = logging.getLogger(__name__)
+
+PENDING_AUTH_FILE = "pending_auth.json"
+
+@dataclass
+class OuraUser:
+    name: str
+    oura: Oura
+    watermarks: SyncWatermarks
+    scheduler: CategoryScheduler
+    labels: list[str] = field(default_factory=list)
+    oura_id: str | None = None
+    heartrate: HeartRateSeries = field(default_factory=HeartRateSeries)
+    # Last applied result per category; Oura returns the same object when a payload is unchanged.
+    applied: dict[str, Any] = field(default_factory=dict)
+
+def load_token_managers(
+    token_dir: str | Path,
+    client_id: str,
+    client_secret: str | None,
+    redirect_uri: str,
+    scopes: list[str] | None,
+    http_client: HttpClient,
+    token_url: str = TOKEN_URL,
+) -> dict[str, OAuthTokenManager]:
+    """Create one token manager per `*.json` token file in `token_dir`, keyed by file stem.
+
+    Users are expected to have completed OAuth consent already (e.g. with a single-user run
+    pointed at the same file); no interactive authorization is attempted here.
+    """
+    managers = {}
+    for token_path in sorted(Path(token_dir).expanduser().glob("*.json")):
+        if token_path.name == PENDING_AUTH_FILE:
+            continue
+        managers[token_path.stem] = OAuthTokenManager(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+            scopes=scopes,
+            token_path=token_path,
+            stdin_is_interactive=False,
+            http_client=http_client,
+            token_url=token_url,
+        )
+    return managers
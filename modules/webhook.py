@@ -0,0 +1,154 @@
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+import urllib.parse
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+import modules.collector as collector
+from modules.users import OuraUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1000
+MAX_BODY_SIZE = 64 * 1024
+
+@dataclass
+class WebhookEvent:
+    user_id: str
+    data_type: str
+    event_type: str
+    object_id: str | None
+    event_time: datetime.datetime | None
+
+    @classmethod
+    def from_dict(cls, event:dict) -> "WebhookEvent":
+        event_time = event.get("event_time")
+        return cls(
+            user_id=event["user_id"],
+            data_type=event["data_type"],
+            event_type=event.get("event_type", "update"),
+            object_id=event.get("object_id"),
+            event_time=datetime.datetime.fromisoformat(event_time) if event_time else None,
+        )
+
+class WebhookReceiver:
+    """Accepts Oura webhook notifications and turns them into targeted refreshes.
+
+    The HTTP handler only verifies and enqueues events, so Oura gets a fast answer. A worker
+    thread looks up the `day` of the changed record, rewinds the user's watermark to it and
+    calls `on_change(user, category_name)` so the category is fetched right away. A full queue
+    answers 503 so Oura retries the delivery later.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        users: list[OuraUser],
+        categories: list[str],
+        on_change: Callable[[OuraUser, str], None],
+        verification_token: str | None = None,
+        client_secret: str | None = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.users = { user.oura_id: user for user in users if user.oura_id != None }
+        self.categories = set(categories)
+        self.on_change = on_change
+        self.verification_token = verification_token
+        self.client_secret = client_secret
+        self.events: queue.Queue[WebhookEvent] = queue.Queue(maxsize=queue_size)
+        self.server = ThreadingHTTPServer(("", port), self._handler())
+        self.server.daemon_threads = True
+        if client_secret == None:
+            logging.warning("OURA_CLIENT_SECRET is not set; webhook signatures are not verified.")
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="webhook-server", daemon=True).start()
+        threading.Thread(target=self._run, name="webhook-events", daemon=True).start()
+
+    def verify_signature(self, body:bytes, timestamp:str | None, signature:str | None) -> bool:
+        if self.client_secret == None:
+            return True
+        if not timestamp or not signature:
+            return False
+        expected = hmac.new(self.client_secret.encode(), timestamp.encode() + body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected.lower(), signature.lower())
+
+    def _run(self) -> None:
+        while True:
+            event = self.events.get()
+            try:
+                self._process(event)
+            except Exception as e:
+                logging.error(f"Handling {event.data_type} webhook event failed: {e}")
+
+    def _process(self, event:WebhookEvent) -> None:
+        user = self.users.get(event.user_id)
+        if user == None or event.data_type not in self.categories:
+            logging.debug(f"Ignoring {event.event_type} webhook event for {event.data_type}.")
+            return
+        day = None
+        if event.object_id and event.event_type != "delete":
+            day = collector.fetch_document_day(user.oura, event.data_type, event.object_id)
+        if day == None and event.event_time != None:
+            day = event.event_time.date()
+        if day != None:
+            user.watermarks.rewind(event.data_type, day)
+        logging.info(f"{event.data_type} {event.event_type} event for {user.name}; refreshing from {day}.")
+        self.on_change(user, event.data_type)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+                token = query.get("verification_token", [None])[0]
+                challenge = query.get("challenge", [None])[0]
+                if challenge == None or receiver.verification_token == None or token == None \
+                        or not hmac.compare_digest(token, receiver.verification_token):
+                    self._reply(401)
+                    return
+                self._reply(200, { "challenge": challenge })
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                if length > MAX_BODY_SIZE:
+                    self._reply(413)
+                    return
+                body = self.rfile.read(length)
+                if not receiver.verify_signature(body, self.headers.get("x-oura-timestamp"), self.headers.get("x-oura-signature")):
+                    self._reply(401)
+                    return
+                try:
+                    event = WebhookEvent.from_dict(json.loads(body))
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.warning(f"Malformed webhook event: {e}")
+                    self._reply(400)
+                    return
+                try:
+                    receiver.events.put_nowait(event)
+                except queue.Full:
+                    logging.warning("Webhook event queue is full; asking Oura to retry.")
+                    self._reply(503)
+                    return
+                self._reply(204)
+
+            def _reply(self, status:int, payload:dict | None = None):
+                body = json.dumps(payload).encode() if payload != None else b""
+                self.send_response(status)
+                if payload != None:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
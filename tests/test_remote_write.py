@@ -0,0 +1,159 @@
+import contextlib
+import io
+import os
+import random
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer
+
+from benchmarks.remote_write_receiver import RemoteWriteHandler, decode_write_request
+from modules import snappy
+from modules.http_client import HttpClient
+from modules.remote_write import RemoteWriter, encode_write_request
+
+
+class SnappyTest(unittest.TestCase):
+
+    def assertRoundTrip(self, data: bytes) -> bytes:
+        compressed = snappy.compress(data)
+        self.assertEqual(snappy.decompress(compressed), data)
+        return compressed
+
+    def test_round_trip(self):
+        rng = random.Random(0)
+        cases = {
+            "empty": b"",
+            "short": b"abc",
+            "repeated": b"oura_heartrate_bpm" * 500,
+            "random": bytes(rng.randrange(256) for _ in range(5000)),
+            "long literal": bytes(range(256)) * 2,
+            "several blocks": b"".join(f"sample {i % 997} {i}\n".encode() for i in range(20000)),
+        }
+        for name, data in cases.items():
+            with self.subTest(name):
+                self.assertRoundTrip(data)
+
+    def test_compresses_repetition(self):
+        data = b"__name__oura_readiness_score" * 1000
+        self.assertLess(len(self.assertRoundTrip(data)), len(data) // 10)
+
+    def test_block_boundary(self):
+        data = os.urandom(10) * (snappy.MAX_BLOCK_SIZE // 10 + 1)
+        self.assertGreater(len(data), snappy.MAX_BLOCK_SIZE)
+        self.assertRoundTrip(data)
+
+    def test_decompress_reference_stream(self):
+        # Length 9, literal "abc", then a 1-byte-offset copy of 6 bytes at offset 3.
+        self.assertEqual(snappy.decompress(bytes([9, 2 << 2, 97, 98, 99, 0x01 | (2 << 2), 3])), b"abcabcabc")
+
+    def test_decompress_rejects_bad_offset(self):
+        with self.assertRaises(snappy.SnappyError):
+            snappy.decompress(bytes([4, 0x01, 5]))
+
+
+class WriteRequestTest(unittest.TestCase):
+
+    def test_decoded_series(self):
+        samples = [
+            ("oura_readiness_score", {"email": "a@example.com"}, 85.0, 1760659200000),
+            ("oura_readiness_score", {"email": "a@example.com"}, 80.0, 1760572800000),
+            ("oura_heartrate_bpm", {"email": "b@example.com", "source": "awake"}, 61.5, 1760661000123),
+        ]
+        decoded = decode_write_request(snappy.decompress(snappy.compress(encode_write_request(samples))))
+        self.assertEqual(decoded, [
+            ({"__name__": "oura_readiness_score", "email": "a@example.com"}, 80.0, 1760572800000),
+            ({"__name__": "oura_readiness_score", "email": "a@example.com"}, 85.0, 1760659200000),
+            ({"__name__": "oura_heartrate_bpm", "email": "b@example.com", "source": "awake"}, 61.5, 1760661000123),
+        ])
+
+    def test_labels_are_sorted(self):
+        encoded = encode_write_request([("m", {"z": "1", "a": "2"}, 1.0, 0)])
+        self.assertEqual(list(decode_write_request(encoded)[0][0]), ["__name__", "a", "z"])
+
+
+class RemoteWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        RemoteWriteHandler.received = []
+        self.http_client = HttpClient()
+        self.addCleanup(self.http_client.close)
+        self.serve(RemoteWriteHandler)
+
+    def serve(self, handler: type) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def writer(self, **kwargs) -> RemoteWriter:
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v1/write"
+        return RemoteWriter(url, self.http_client, flush_interval=0.05, **kwargs)
+
+    def wait_for(self, writer: RemoteWriter, count: int) -> None:
+        deadline = time.monotonic() + 5
+        while writer.sent + writer.dropped < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_sends_decodable_batches(self):
+        writer = self.writer(batch_size=2)
+        samples = [ ("oura_sleep_score", {"email": "a@example.com"}, float(70 + i), 1760572800000 + i * 86400000) for i in range(5) ]
+        # The repeated last sample is skipped as already sent.
+        with contextlib.redirect_stdout(io.StringIO()):  # the receiver prints what it gets
+            self.assertEqual(writer.submit(samples + samples[-1:]), 0)
+            self.wait_for(writer, len(samples))
+        self.assertEqual(writer.sent, len(samples))
+        self.assertEqual(writer.dropped, 0)
+        received = sorted(RemoteWriteHandler.received, key=lambda s: s[2])
+        self.assertEqual(received, [ ({"__name__": name, **labels}, value, ts) for name, labels, value, ts in samples ])
+
+    def test_revised_value_is_sent_later(self):
+        writer = self.writer()
+        day_start = 1760572800000
+        with contextlib.redirect_stdout(io.StringIO()):
+            writer.submit([ ("oura_sleep_score", {"email": "a@example.com"}, 70.0, day_start) ])
+            writer.submit([ ("oura_sleep_score", {"email": "a@example.com"}, 74.0, day_start) ])
+            writer.submit([ ("oura_sleep_score", {"email": "a@example.com"}, 74.0, day_start) ])
+            self.wait_for(writer, 2)
+        received = sorted(RemoteWriteHandler.received, key=lambda s: s[2])
+        self.assertEqual([ value for _, value, _ in received ], [70.0, 74.0])
+        self.assertEqual(received[0][2], day_start)
+        self.assertGreater(received[1][2], day_start)
+
+    def test_rejected_samples_do_not_drop_the_batch(self):
+        self.serve(RejectingHandler)
+        writer = self.writer(batch_size=8)
+        samples = [ ("oura_sleep_score", {"email": f"{i}@example.com"}, float(-1 if i in (2, 5) else 70), 1760572800000) for i in range(8) ]
+        with contextlib.redirect_stdout(io.StringIO()), self.assertLogs(level="ERROR"):
+            writer.submit(samples)
+            self.wait_for(writer, len(samples))
+        self.assertEqual((writer.sent, writer.dropped), (6, 2))
+        self.assertEqual(sorted(labels["email"] for labels, _, _ in RemoteWriteHandler.received), [ f"{i}@example.com" for i in (0, 1, 3, 4, 6, 7) ])
+
+    def test_stale_series_are_forgotten(self):
+        writer = self.writer(series_ttl=0.0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            writer.submit([ ("oura_sleep_score", {"email": "a@example.com", "day": "2026-10-01"}, 70.0, 1760572800000) ])
+            writer.submit([ ("oura_sleep_score", {"email": "a@example.com", "day": "2026-10-02"}, 71.0, 1760659200000) ])
+            self.wait_for(writer, 2)
+        self.assertEqual(list(writer._last_sent), [ ("oura_sleep_score", (("day", "2026-10-02"), ("email", "a@example.com"))) ])
+
+
+class RejectingHandler(RemoteWriteHandler):
+    """Rejects a whole request with 400 when any sample in it is negative, like a strict receiver."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        samples = decode_write_request(snappy.decompress(body))
+        if any(value < 0 for _, value, _ in samples):
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(b"out of order sample")
+            return
+        RemoteWriteHandler.received.extend(samples)
+        self.send_response(204)
+        self.end_headers()
+
+
+if __name__ == "__main__":
+    unittest.main()
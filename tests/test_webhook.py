@@ -0,0 +1,86 @@
+import datetime
+import queue
+import unittest
+import urllib.error
+from types import SimpleNamespace
+
+from benchmarks.webhook_sender import send, verify
+from modules.scheduler import CategoryScheduler
+from modules.sync import SyncWatermarks
+from modules.users import OuraUser
+from modules.webhook import WebhookReceiver
+
+SECRET = "client-secret"
+TOKEN = "verification-token"
+DAY = datetime.date(2026, 10, 10)
+
+
+class FakeOura:
+    def __init__(self):
+        self.documents = []
+
+    def get_document(self, path, document_id, data_class):
+        self.documents.append((path, document_id))
+        return SimpleNamespace(day=DAY)
+
+
+class WebhookReceiverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.oura = FakeOura()
+        self.user = OuraUser(
+            name="default",
+            oura=self.oura,
+            watermarks=SyncWatermarks(),
+            scheduler=CategoryScheduler({ "daily_sleep": 60 }),
+            oura_id="user0",
+        )
+        self.user.watermarks.update("daily_sleep", SimpleNamespace(data=[SimpleNamespace(day=DAY + datetime.timedelta(days=5))]))
+        self.changes = queue.Queue()
+        self.receiver = WebhookReceiver(
+            0, [self.user], ["daily_sleep"], lambda user, category: self.changes.put((user, category)),
+            verification_token=TOKEN, client_secret=SECRET,
+        )
+        self.receiver.start()
+        self.addCleanup(self.receiver.server.server_close)
+        self.addCleanup(self.receiver.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.receiver.server.server_address[1]}/"
+
+    def event(self, **fields) -> dict:
+        return { "user_id": "user0", "data_type": "daily_sleep", "event_type": "update", "object_id": "doc-1", **fields }
+
+    def test_signed_event_triggers_refresh(self):
+        self.assertEqual(send(self.url, SECRET, self.event()), 204)
+        user, category = self.changes.get(timeout=5)
+        self.assertIs(user, self.user)
+        self.assertEqual(category, "daily_sleep")
+        self.assertEqual(self.oura.documents, [("daily_sleep", "doc-1")])
+        self.assertEqual(self.user.watermarks.get("daily_sleep"), DAY)
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(send(self.url, "another-secret", self.event()), 401)
+        self.assertEqual(send(self.url, None, self.event()), 401)
+        self.assertTrue(self.receiver.events.empty())
+        self.assertTrue(self.changes.empty())
+
+    def test_unknown_user_is_ignored(self):
+        self.assertEqual(send(self.url, SECRET, self.event(user_id="someone-else")), 204)
+        self.assertEqual(send(self.url, SECRET, self.event()), 204)
+        # Events are handled in order, so the first one was dropped when the second arrives.
+        user, _ = self.changes.get(timeout=5)
+        self.assertIs(user, self.user)
+        self.assertTrue(self.changes.empty())
+
+    def test_malformed_event_is_rejected(self):
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(send(self.url, SECRET, { "data_type": "daily_sleep" }), 400)
+
+    def test_verification_challenge(self):
+        self.assertEqual(verify(self.url, TOKEN), b'{"challenge": "oura-exporter"}')
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            verify(self.url, "wrong-token")
+        self.assertEqual(raised.exception.code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()